@@ -3,11 +3,44 @@
 # The main implementation uses Node.js (see server.js and bot/ directory)
 
 import os
+import re
+import sys
+import bisect
+import heapq
+import hashlib
+import hmac
+import html
+import queue
 import json
+import math
+import random
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import time
 import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache, wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    import httpx  # Optional, enables HTTP/2
+except ImportError:
+    httpx = None
+
+try:
+    import redis  # Optional, shared lookup cache
+except ImportError:
+    redis = None
+
+try:
+    import websockets  # Optional, streaming ingest
+except ImportError:
+    websockets = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +53,11 @@ ALCHEMY_API_KEY_ETH = os.getenv("ALCHEMY_API_KEY_ETH", "your_alchemy_eth_api_key
 ALCHEMY_API_KEY_BASE = os.getenv("ALCHEMY_API_KEY_BASE", "your_alchemy_base_api_key")
 MORALIS_API_KEY = os.getenv("MORALIS_API_KEY", "your_moralis_api_key")
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY", "your_helius_solana_api_key")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# "mock" simulates purchases, "rpc" detects them from the chains' rpc_url
+DATA_SOURCE = os.getenv("DATA_SOURCE", "mock")
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "8"))
 
 # Supported chains configuration
 SUPPORTED_CHAINS = {
@@ -27,50 +65,878 @@ SUPPORTED_CHAINS = {
         'name': 'Ethereum',
         'symbol': 'ETH',
         'explorer': 'https://etherscan.io',
-        'rpc_url': f'https://eth-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_ETH}',
-        'native_price': 3500  # Placeholder - should be fetched from price API
+        'rpc_url': os.getenv("ETH_RPC_URL", f'https://eth-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_ETH}'),
+        'ws_url': os.getenv("ETH_WS_URL", f'wss://eth-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_ETH}'),
+        'native_price': 3500,  # Fallback until the native price feed has refreshed
+        'price_id': 'ethereum',
+        'max_in_flight': 4,
+        # RPC requests the adaptive scheduler may spend per cycle on chains polled per contract
+        'poll_budget': int(os.getenv("ETH_POLL_BUDGET", "200"))
     },
     'SOLANA': {
         'name': 'Solana',
         'symbol': 'SOL',
         'explorer': 'https://solscan.io',
-        'rpc_url': f'https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}',
-        'native_price': 150
+        'rpc_url': os.getenv("SOLANA_RPC_URL", f'https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}'),
+        'ws_url': os.getenv("SOLANA_WS_URL", f'wss://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}'),
+        'native_price': 150,
+        'price_id': 'solana',
+        'max_in_flight': 8,
+        'poll_budget': int(os.getenv("SOLANA_POLL_BUDGET", "100"))
     },
     'BNB': {
         'name': 'BNB Chain',
         'symbol': 'BNB',
         'explorer': 'https://bscscan.com',
-        'rpc_url': 'https://bsc-dataseed.binance.org/',
-        'native_price': 600
+        'rpc_url': os.getenv("BNB_RPC_URL", 'https://bsc-dataseed.binance.org/'),
+        'ws_url': os.getenv("BNB_WS_URL"),  # No public websocket endpoint
+        'native_price': 600,
+        'price_id': 'binancecoin',
+        'max_in_flight': 4,
+        'poll_budget': int(os.getenv("BNB_POLL_BUDGET", "200"))
     },
     'BASE': {
         'name': 'Base',
         'symbol': 'ETH',
         'explorer': 'https://basescan.org',
-        'rpc_url': f'https://base-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_BASE}',
-        'native_price': 3500
+        'rpc_url': os.getenv("BASE_RPC_URL", f'https://base-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_BASE}'),
+        'ws_url': os.getenv("BASE_WS_URL", f'wss://base-mainnet.g.alchemy.com/v2/{ALCHEMY_API_KEY_BASE}'),
+        'native_price': 3500,
+        'price_id': 'ethereum',
+        'max_in_flight': 4,
+        'poll_budget': int(os.getenv("BASE_POLL_BUDGET", "200"))
     }
 }
 
-# --- Mock Database (In production, use a real database like Supabase) ---
-# This simulates the bot_configs table structure
-bot_configs = {
-    # Example structure:
-    # chat_id: {
-    #     'watched_tokens': {
-    #         'ETH': ['0xContractAddress1', '0xContractAddress2'],
-    #         'BNB': ['0xContractAddress3']
-    #     },
-    #     'custom_gif_url': 'https://example.com/buy_gif.gif',
-    #     'custom_emoji': '💸'
-    # }
+# --- HTTP Client Layer ---
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "16"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# Errors raised by either transport
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+class HttpClient:
+    """
+    Shared keep-alive client used by every outbound call (Telegram and RPC).
+    Connections are pooled per host so steady traffic reuses warm TCP/TLS
+    connections instead of handshaking on every request. HTTP/2 is used when
+    enabled and httpx is installed.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, pool_hosts=HTTP_POOL_HOSTS, http2=HTTP2_ENABLED):
+        self.http2 = http2 and httpx is not None
+        if http2 and not self.http2:
+            logger.warning("HTTP2_ENABLED is set but httpx is not installed, falling back to HTTP/1.1")
+
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._connections = {}
+        if self.http2:
+            limits = httpx.Limits(max_connections=pool_size * pool_hosts,
+                                  max_keepalive_connections=pool_size * pool_hosts)
+            self._client = httpx.Client(http2=True, limits=limits)
+        else:
+            self._adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+            self._session = requests.Session()
+            self._session.mount('https://', self._adapter)
+            self._session.mount('http://', self._adapter)
+
+    def request(self, method, url, timeout=10, **kwargs):
+        """Send a request over a pooled connection and return the response."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+        if not self.http2:
+            return self._session.request(method, url, timeout=timeout, **kwargs)
+
+        def trace(event, info):
+            if event == "connection.connect_tcp.complete":
+                with self._lock:
+                    self._connections[host] = self._connections.get(host, 0) + 1
+
+        return self._client.request(method, url, timeout=timeout,
+                                    extensions={"trace": trace}, **kwargs)
+
+    def post(self, url, json=None, timeout=10, headers=None):
+        return self.request("POST", url, timeout=timeout, json=json, headers=headers)
+
+    def get(self, url, params=None, timeout=10, headers=None):
+        return self.request("GET", url, timeout=timeout, params=params, headers=headers)
+
+    def pool_stats(self):
+        """Per-host request, new-connection and reuse counts."""
+        with self._lock:
+            connections = dict(self._connections)
+            requests_by_host = dict(self._requests)
+        if not self.http2:
+            pools = self._adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    host = f"{pool.host}:{pool.port}" if pool.port not in (80, 443) else pool.host
+                    connections[host] = connections.get(host, 0) + pool.num_connections
+
+        stats = {}
+        for host, count in requests_by_host.items():
+            new_connections = connections.get(host, 0)
+            stats[host] = {
+                'requests': count,
+                'new_connections': new_connections,
+                'reuses': max(count - new_connections, 0)
+            }
+        return stats
+
+http_client = HttpClient()
+
+# --- Metrics ---
+METRICS_PREFIX = "buyxanbot"
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonic counter per label-value tuple."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+class Histogram:
+    """Prometheus-style cumulative histogram per label-value tuple."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        return _HistogramTimer(self, label_values)
+
+    def samples(self):
+        with self._lock:
+            series_by_labels = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in series_by_labels.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labels, label_values, [('le', bound)]), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), series[-1]
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), cumulative
+
+class _HistogramTimer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+class MetricsRegistry:
+    """
+    Metrics exported in the Prometheus text format on /metrics.
+    Counters and histograms are updated on the hot path; gauges and the
+    components' existing `stats` dicts are only read when scraped.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = []
+        self._gauges = []  # (name, help, fn) where fn returns a number
+        self._stats = []   # (name, fn, gauge keys, label) where fn returns a stats dict
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(f"{self.prefix}_{name}", help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=METRICS_BUCKETS):
+        metric = Histogram(f"{self.prefix}_{name}", help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, fn):
+        self._gauges.append((f"{self.prefix}_{name}", help_text, fn))
+
+    def add_stats(self, name, fn, gauges=(), label=None):
+        """
+        Export a component's stats dict: numeric keys as counters, `gauges`
+        keys as gauges. With `label`, fn returns one stats dict per value of
+        that label (e.g. per host) and each key is one labelled series.
+        """
+        self._stats.append((f"{self.prefix}_{name}", fn, set(gauges), label))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        for name, help_text, fn in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                logger.warning(f"Gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        for prefix, fn, gauge_keys, label in self._stats:
+            try:
+                stats = fn()
+            except Exception as e:
+                logger.warning(f"Stats for {prefix} failed: {e}")
+                continue
+            # A metric's samples must be contiguous, so labelled series are grouped by key first
+            series = {}
+            for label_value, values in (stats.items() if label else [(None, stats)]):
+                labels = _format_labels((label,), (label_value,)) if label else ""
+                for key, value in values.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    series.setdefault(key, []).append(f"{labels} {value}")
+            for key, samples in series.items():
+                name = f"{prefix}_{key}" if key in gauge_keys else f"{prefix}_{key}_total"
+                lines.append(f"# TYPE {name} {'gauge' if key in gauge_keys else 'counter'}")
+                lines.extend(f"{name}{sample}" for sample in samples)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    'stage_seconds', 'Time spent per pipeline stage and chain.', ('stage', 'chain'))
+UPSTREAM_SECONDS = metrics.histogram(
+    'upstream_request_seconds', 'Upstream request latency by upstream, chain and method.',
+    ('upstream', 'chain', 'method'))
+ALERTS_SENT = metrics.counter('alerts_total', 'Buy alerts queued for delivery.', ('chain', 'kind'))
+BELOW_MIN_BUY = metrics.counter(
+    'purchases_below_min_buy_total', 'Purchases dropped before enrichment: below every subscriber\'s minimum.', ('chain',))
+UNCLASSIFIED_TRANSFERS = metrics.counter(
+    'transfers_unclassified_total', 'Transfers not alerted: the token has no indexed DEX pool to tell buys apart.', ('chain',))
+
+def timed_stage(stage, chain_of=lambda *args: ''):
+    """Decorator recording a call's duration in STAGE_SECONDS; `chain_of(*args)` gives the chain label."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage, chain_of(*args))
+        return wrapper
+    return decorate
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "10000"))
+PROFILER_MAX_DEPTH = 64
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for every thread, switched on and off at runtime.
+    While running, a daemon thread reads sys._current_frames() every
+    `interval` seconds and counts collapsed stacks ("outer;...;inner <count>",
+    the flamegraph.pl input format). Frames are keyed by function, not line,
+    so the number of distinct stacks stays small. The only cost is one frame
+    walk per thread per sample: about 1% of a core at the default 100 Hz.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL, max_stacks=PROFILER_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling (idempotent); stacks accumulate until reset()."""
+        with self._lock:
+            if self.running:
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({1 / self.interval:.0f} Hz)")
+
+    def stop(self, timeout=5):
+        """Stop sampling and wait up to `timeout` seconds for the sampler thread to exit."""
+        with self._lock:
+            self._stop.set()
+            thread = self._thread
+        # Joined outside the lock, which the sampler takes to record its last sample
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning(f"Sampling profiler thread still running {timeout}s after stop")
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        own_thread = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            names = []
+            while frame is not None and len(names) < PROFILER_MAX_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks.append(";".join(reversed(names)))
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = "[truncated]"
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def collapsed(self):
+        """Collapsed stacks, most sampled first."""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+sampling_profiler = SamplingProfiler()
+if PROFILER_ENABLED:
+    sampling_profiler.start()
+
+# --- Config Store ---
+# DATABASE_URL selects the persistent backend, e.g. sqlite:///buyxanbot.db.
+# Without it configs only live in memory.
+DATABASE_URL = os.getenv("DATABASE_URL")
+# Default home of the local SQLite files (alert journal, pool index, worker
+# leases): next to app.py rather than wherever the process was started.
+DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+EVM_ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+def decode_base58(value):
+    """Decode a base58 string; raises ValueError on characters outside the alphabet."""
+    number = 0
+    for char in value:
+        if char not in BASE58_INDEX:
+            raise ValueError(f"Invalid base58 character: {char!r}")
+        number = number * 58 + BASE58_INDEX[char]
+    leading_zeros = len(value) - len(value.lstrip('1'))
+    return b'\0' * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, 'big')
+
+def normalize_token_address(chain, address):
+    """
+    Canonical key for a token address, raising ValueError if it is malformed.
+    EVM addresses are lowercased so checksummed and lowercase forms match;
+    Solana mints are case-sensitive base58 and must decode to 32 bytes.
+    """
+    address = address.strip()
+    if chain == 'SOLANA':
+        if len(decode_base58(address)) != 32:
+            raise ValueError(f"Invalid Solana address: {address}")
+        return address
+    else:
+        # Ethereum-style addresses (ETH, BNB, BASE)
+        if not EVM_ADDRESS_RE.match(address):
+            raise ValueError(f"Invalid {chain} address: {address}")
+        return address.lower()
+
+def new_chat_config():
+    """Default configuration for a chat seen for the first time."""
+    return {
+        'watched_tokens': {chain: {} for chain in SUPPORTED_CHAINS},
+        'custom_gif_url': None,
+        'custom_emoji': '🟢',
+        'min_buy_usd': 0.0  # Buys below this USD value are not alerted (/setminbuy)
+    }
+
+class ConfigStore:
+    """
+    In-memory chat config index with write-through persistence hooks.
+    `configs` is the hot read path used by the monitor loop (the bot_configs
+    dict); every mutation goes through the methods below so subclasses can
+    persist it before the in-memory index is updated.
+
+    watched_tokens[chain] is an insertion-ordered set of canonical addresses
+    (see normalize_token_address), stored as a dict mapping each canonical
+    address to the form the user first entered for display.
+
+    `gif_file_ids` maps each GIF URL to the Telegram file_id of its first
+    upload, shared by every chat using that URL.
+
+    Example structure of `configs`:
+    chat_id: {
+        'watched_tokens': {
+            'ETH': {'0xcontractaddress1': '0xContractAddress1'},
+            'BNB': {'0xcontractaddress3': '0xContractAddress3'}
+        },
+        'custom_gif_url': 'https://example.com/buy_gif.gif',
+        'custom_emoji': '💸',
+        'min_buy_usd': 50.0
+    }
+    """
+
+    def __init__(self):
+        self.configs = {}
+        self.cursors = {}
+        self.gif_file_ids = {}
+        # Live (chain, contract) -> set(chat_id) index for event-driven ingest
+        self.subscriptions = {}
+        # (chain, contract) -> sorted [(min_buy_usd, chat_id)] of its subscribers with a minimum.
+        # Lists are replaced, never mutated, so detection threads read them without the lock.
+        self.min_buys = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    # Whether writes made by other processes reach this store's load()
+    shared = False
+
+    def load(self, owns=None):
+        """
+        Bulk-load stored configs into the in-memory index. With `owns(chain,
+        contract)`, only those watched tokens (and the chats watching them) are kept.
+        """
+
+    def version(self):
+        """Counter bumped by every stored config change from any process, or None if untracked."""
+        return None
+
+    def add_listener(self, callback):
+        """Call `callback(chain, token_key)` whenever a chat starts or stops watching a token."""
+        self._listeners.append(callback)
+
+    def _notify(self, chain, token_key):
+        for callback in self._listeners:
+            try:
+                callback(chain, token_key)
+            except Exception as e:
+                logger.error(f"Watchlist listener failed for {token_key} on {chain}: {e}")
+
+    def watched_contracts(self, chain):
+        """Distinct contracts watched on `chain` by any chat."""
+        with self._lock:
+            return [contract for watched_chain, contract in self.subscriptions if watched_chain == chain]
+
+    def get_cursor(self, key, default=None):
+        """Last processed position (block number, signature...) for a detection cursor."""
+        return self.cursors.get(key, default)
+
+    def set_cursors(self, values):
+        """Persist several detection cursors in one write."""
+        if not values:
+            return
+        with self._lock:
+            self._persist_cursors(values)
+            self.cursors.update(values)
+
+    def ensure_chat(self, chat_id):
+        """Return the chat's config, creating the default one if needed."""
+        with self._lock:
+            config = self.configs.get(chat_id)
+            if config is None:
+                config = new_chat_config()
+                self._persist_chat(chat_id, config)
+                self.configs[chat_id] = config
+            return config
+
+    def add_token(self, chat_id, chain, token_key, display_address=None):
+        """Watch a canonical token address for a chat; returns False if already watched."""
+        with self._lock:
+            tokens = self.ensure_chat(chat_id)['watched_tokens'].setdefault(chain, {})
+            if token_key in tokens:
+                return False
+            display_address = display_address or token_key
+            self._persist_token_added(chat_id, chain, token_key, display_address)
+            tokens[token_key] = display_address
+            self.subscriptions.setdefault((chain, token_key), set()).add(chat_id)
+            self._index_min_buy((chain, token_key), chat_id, 0, self.configs[chat_id].get('min_buy_usd', 0))
+        self._notify(chain, token_key)
+        return True
+
+    def remove_token(self, chat_id, chain, token_key):
+        """Stop watching a canonical token address; returns False if it was not watched."""
+        with self._lock:
+            config = self.configs.get(chat_id)
+            tokens = config['watched_tokens'].get(chain, {}) if config else {}
+            if token_key not in tokens:
+                return False
+            self._persist_token_removed(chat_id, chain, token_key)
+            del tokens[token_key]
+            subscribers = self.subscriptions.get((chain, token_key), set())
+            subscribers.discard(chat_id)
+            if not subscribers:
+                self.subscriptions.pop((chain, token_key), None)
+            self._index_min_buy((chain, token_key), chat_id, config.get('min_buy_usd', 0), 0)
+        self._notify(chain, token_key)
+        return True
+
+    def set_gif(self, chat_id, gif_url):
+        # File_ids are keyed by URL, so a new URL is fetched on its own. Setting
+        # the same URL again means its content may have changed: upload it anew.
+        self._update_chat(chat_id, custom_gif_url=gif_url)
+        self.set_gif_file_id(gif_url, None)
+
+    def get_gif_file_id(self, gif_url):
+        return self.gif_file_ids.get(gif_url)
+
+    def set_gif_file_id(self, gif_url, file_id, replaces=None):
+        """
+        Cache (or with file_id=None, drop) the Telegram file_id for `gif_url`.
+        With `replaces`, only if the cached file_id is still that one.
+        """
+        with self._lock:
+            current = self.gif_file_ids.get(gif_url)
+            if current == file_id or (replaces is not None and current != replaces):
+                return
+            self._persist_gif_file_id(gif_url, file_id)
+            if file_id is None:
+                self.gif_file_ids.pop(gif_url, None)
+            else:
+                self.gif_file_ids[gif_url] = file_id
+
+    def set_emoji(self, chat_id, emoji):
+        self._update_chat(chat_id, custom_emoji=emoji)
+
+    def set_min_buy(self, chat_id, min_buy_usd):
+        with self._lock:
+            config = self.ensure_chat(chat_id)
+            previous = config.get('min_buy_usd', 0)
+            self._update_chat(chat_id, min_buy_usd=min_buy_usd)
+            for chain, tokens in config['watched_tokens'].items():
+                for token_key in tokens:
+                    self._index_min_buy((chain, token_key), chat_id, previous, min_buy_usd)
+
+    def _index_min_buy(self, key, chat_id, previous, min_buy_usd):
+        """Move a chat's entry in a token's threshold list from `previous` to `min_buy_usd`."""
+        entries = list(self.min_buys.get(key, ()))
+        if previous:
+            index = bisect.bisect_left(entries, (previous, chat_id))
+            if index < len(entries) and entries[index] == (previous, chat_id):
+                del entries[index]
+        if min_buy_usd:
+            bisect.insort(entries, (min_buy_usd, chat_id))
+        if entries:
+            self.min_buys[key] = entries
+        else:
+            self.min_buys.pop(key, None)
+
+    def _rebuild_min_buys(self):
+        min_buys = {}
+        for (chain, token_key), chat_ids in self.subscriptions.items():
+            entries = sorted(
+                (self.configs[chat_id].get('min_buy_usd'), chat_id)
+                for chat_id in chat_ids if self.configs[chat_id].get('min_buy_usd')
+            )
+            if entries:
+                min_buys[(chain, token_key)] = entries
+        self.min_buys = min_buys
+
+    def _update_chat(self, chat_id, **fields):
+        with self._lock:
+            config = dict(self.ensure_chat(chat_id), **fields)
+            self._persist_chat(chat_id, config)
+            self.configs[chat_id].update(fields)
+
+    # Persistence hooks, no-ops for the in-memory store
+    def _persist_chat(self, chat_id, config):
+        pass
+
+    def _persist_token_added(self, chat_id, chain, token_key, display_address):
+        pass
+
+    def _persist_token_removed(self, chat_id, chain, token_key):
+        pass
+
+    def _persist_cursors(self, values):
+        pass
+
+    def _persist_gif_file_id(self, gif_url, file_id):
+        pass
+
+class SQLiteConfigStore(ConfigStore):
+    """
+    ConfigStore persisted to SQLite.
+    WAL mode lets webhook writers and readers in other processes work
+    concurrently; in this process reads are served from the in-memory index.
+    Triggers bump config_version on every chat or watched-token write, so
+    other processes can tell cheaply whether they need to reload.
+    """
+
+    shared = True
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS chat_configs (
+            chat_id INTEGER PRIMARY KEY,
+            custom_gif_url TEXT,
+            custom_emoji TEXT NOT NULL,
+            min_buy_usd REAL NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS watched_tokens (
+            chat_id INTEGER NOT NULL,
+            chain TEXT NOT NULL,
+            contract_address TEXT NOT NULL,
+            display_address TEXT,
+            PRIMARY KEY (chat_id, chain, contract_address)
+        )""",
+        """CREATE TABLE IF NOT EXISTS detection_cursors (
+            cursor_key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS gif_file_ids (
+            gif_url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS config_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO config_version (id, version) VALUES (1, 0)",
+        *(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+            BEGIN UPDATE config_version SET version = version + 1; END"""
+            for table in ('chat_configs', 'watched_tokens')
+            for event in ('INSERT', 'UPDATE', 'DELETE')
+        )
+    )
+
+    def __init__(self, path, wal=True):
+        super().__init__()
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if wal and path != ':memory:':
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns missing from databases created by older versions."""
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(watched_tokens)")}
+        if 'display_address' not in columns:
+            self.db.execute("ALTER TABLE watched_tokens ADD COLUMN display_address TEXT")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(chat_configs)")}
+        if 'custom_gif_file_id' in columns:
+            # file_ids used to be cached per chat; they are now shared per URL
+            self.db.execute(
+                "INSERT OR IGNORE INTO gif_file_ids (gif_url, file_id) "
+                "SELECT custom_gif_url, custom_gif_file_id FROM chat_configs "
+                "WHERE custom_gif_url IS NOT NULL AND custom_gif_file_id IS NOT NULL"
+            )
+        if 'min_buy_usd' not in columns:
+            self.db.execute("ALTER TABLE chat_configs ADD COLUMN min_buy_usd REAL NOT NULL DEFAULT 0")
+
+    @classmethod
+    def from_url(cls, database_url):
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return cls(database_url[len("sqlite:///"):] or ':memory:')
+
+    def version(self):
+        return self.db.execute("SELECT version FROM config_version").fetchone()[0]
+
+    def load(self, owns=None):
+        configs = {}
+        subscriptions = {}
+        for chat_id, gif_url, emoji, min_buy_usd in self.db.execute(
+                "SELECT chat_id, custom_gif_url, custom_emoji, min_buy_usd FROM chat_configs"):
+            config = configs[chat_id] = new_chat_config()
+            config['custom_gif_url'] = gif_url
+            config['custom_emoji'] = emoji
+            config['min_buy_usd'] = min_buy_usd
+        watching = set()
+        for chat_id, chain, contract_address, display_address in self.db.execute(
+                "SELECT chat_id, chain, contract_address, display_address FROM watched_tokens ORDER BY rowid"):
+            try:
+                token_key = normalize_token_address(chain, contract_address)
+            except ValueError:
+                token_key = contract_address
+            if owns is not None and not owns(chain, token_key):
+                continue
+            watching.add(chat_id)
+            config = configs.setdefault(chat_id, new_chat_config())
+            # setdefault keeps the first of any rows that only differed by case
+            config['watched_tokens'].setdefault(chain, {}).setdefault(
+                token_key, display_address or contract_address
+            )
+            subscriptions.setdefault((chain, token_key), set()).add(chat_id)
+        if owns is not None:
+            configs = {chat_id: config for chat_id, config in configs.items() if chat_id in watching}
+
+        cursors = dict(self.db.execute("SELECT cursor_key, value FROM detection_cursors"))
+        gif_file_ids = dict(self.db.execute("SELECT gif_url, file_id FROM gif_file_ids"))
+
+        with self._lock:
+            self.configs.clear()
+            self.configs.update(configs)
+            self.subscriptions = subscriptions
+            self.cursors = cursors
+            self.gif_file_ids = gif_file_ids
+            self._rebuild_min_buys()
+        logger.info(f"Loaded {len(configs)} chat configs ({len(subscriptions)} tokens) from {self.path}")
+
+    def _persist_chat(self, chat_id, config):
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO chat_configs (chat_id, custom_gif_url, custom_emoji, min_buy_usd) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET "
+                "custom_gif_url = excluded.custom_gif_url, "
+                "custom_emoji = excluded.custom_emoji, "
+                "min_buy_usd = excluded.min_buy_usd",
+                (chat_id, config['custom_gif_url'], config['custom_emoji'], config.get('min_buy_usd', 0))
+            )
+
+    def _persist_token_added(self, chat_id, chain, token_key, display_address):
+        with self._lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO watched_tokens (chat_id, chain, contract_address, display_address) "
+                "VALUES (?, ?, ?, ?)",
+                (chat_id, chain, token_key, display_address)
+            )
+
+    def _persist_token_removed(self, chat_id, chain, token_key):
+        with self._lock:
+            # Legacy rows may still hold a non-canonical spelling of the address
+            self.db.execute(
+                "DELETE FROM watched_tokens WHERE chat_id = ? AND chain = ? AND "
+                "(contract_address = ? OR (? != 'SOLANA' AND lower(contract_address) = ?))",
+                (chat_id, chain, token_key, chain, token_key)
+            )
+
+    def _persist_cursors(self, values):
+        with self._lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT INTO detection_cursors (cursor_key, value) VALUES (?, ?) "
+                "ON CONFLICT(cursor_key) DO UPDATE SET value = excluded.value",
+                [(key, str(value)) for key, value in values.items()]
+            )
+            self.db.execute("COMMIT")
+
+    def _persist_gif_file_id(self, gif_url, file_id):
+        with self._lock:
+            if file_id is None:
+                self.db.execute("DELETE FROM gif_file_ids WHERE gif_url = ?", (gif_url,))
+            else:
+                self.db.execute(
+                    "INSERT INTO gif_file_ids (gif_url, file_id) VALUES (?, ?) "
+                    "ON CONFLICT(gif_url) DO UPDATE SET file_id = excluded.file_id",
+                    (gif_url, file_id)
+                )
+
+# DATABASE_URL scheme -> store class; other backends register here
+CONFIG_STORE_BACKENDS = {
+    'sqlite': SQLiteConfigStore
 }
 
+def create_config_store(database_url=DATABASE_URL):
+    """Create and load the config store selected by DATABASE_URL."""
+    if not database_url:
+        return ConfigStore()
+    scheme = urlsplit(database_url).scheme
+    backend = CONFIG_STORE_BACKENDS.get(scheme)
+    if backend is None:
+        raise ValueError(f"Unsupported DATABASE_URL scheme: {scheme}")
+    store = backend.from_url(database_url)
+    store.load()
+    return store
+
+config_store = create_config_store()
+
+# Hot read path for the monitor loop
+bot_configs = config_store.configs
+
 # --- Telegram API Functions ---
-def send_telegram_message(chat_id, text, parse_mode="HTML", reply_markup=None):
-    """Send a text message to a Telegram chat."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+class TelegramRateLimited(Exception):
+    """Raised when the Bot API answers 429 Too Many Requests."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited by Telegram, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def call_telegram_api(method, payload):
+    """
+    POST a Bot API method and return the decoded JSON response.
+    Raises TelegramRateLimited on 429 so callers can honour retry_after.
+    """
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}"
+    response = http_client.post(url, json=payload, timeout=10)
+    if response.status_code == 429:
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+        except ValueError:
+            retry_after = int(response.headers.get('Retry-After', 1))
+        raise TelegramRateLimited(retry_after)
+    response.raise_for_status()
+    return response.json()
+
+def telegram_call_succeeded(future):
+    """Whether a dispatcher Future carries an accepted API call; failed calls resolve to None."""
+    if future.exception() is not None:
+        return False
+    result = future.result()
+    return bool(result and result.get('ok'))
+
+def send_telegram_message(chat_id, text, parse_mode="HTML", reply_markup=None,
+                          priority=None, wait=True):
+    """
+    Send a text message to a Telegram chat through the outbound dispatcher.
+    Blocks until sent and returns the API response unless wait=False, in
+    which case a Future is returned.
+    """
     payload = {
         "chat_id": chat_id,
         "text": text,
@@ -78,51 +944,238 @@ def send_telegram_message(chat_id, text, parse_mode="HTML", reply_markup=None):
     }
     if reply_markup:
         payload["reply_markup"] = json.dumps(reply_markup)
-    
-    try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        logger.info(f"Message sent to {chat_id}: Success")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending message to {chat_id}: {e}")
-        return None
 
-def send_telegram_animation(chat_id, animation_url):
-    """Send an animation (GIF) to a Telegram chat."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAnimation"
+    future = telegram_dispatcher.submit(chat_id, "sendMessage", payload, priority)
+    return future.result() if wait else future
+
+def send_telegram_animation(chat_id, animation, caption=None, parse_mode="HTML",
+                            priority=None, wait=True):
+    """
+    Send an animation (GIF) to a Telegram chat through the outbound dispatcher.
+    `animation` is a URL or the file_id of a previously uploaded animation.
+    """
     payload = {
         "chat_id": chat_id,
-        "animation": animation_url
+        "animation": animation
     }
-    try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        logger.info(f"Animation sent to {chat_id}: Success")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending animation to {chat_id}: {e}")
-        return None
+    if caption:
+        payload["caption"] = caption
+        payload["parse_mode"] = parse_mode
+    future = telegram_dispatcher.submit(chat_id, "sendAnimation", payload, priority)
+    return future.result() if wait else future
 
-def set_telegram_webhook(webhook_url):
-    """Set the webhook URL for the Telegram bot."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/setWebhook"
+def set_telegram_webhook(webhook_url, secret_token=None):
+    """
+    Set the webhook URL for the Telegram bot.
+    Telegram echoes `secret_token` (default TELEGRAM_WEBHOOK_SECRET) in the
+    X-Telegram-Bot-Api-Secret-Token header of every delivery.
+    """
     payload = {"url": webhook_url}
+    secret_token = secret_token or TELEGRAM_WEBHOOK_SECRET
+    if secret_token:
+        payload["secret_token"] = secret_token
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        logger.info(f"Webhook set: {response.json()}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        result = call_telegram_api("setWebhook", payload)
+        logger.info(f"Webhook set: {result}")
+        return result
+    except HTTP_ERRORS + (TelegramRateLimited,) as e:
         logger.error(f"Error setting webhook: {e}")
         return None
 
+# --- Telegram Outbound Dispatcher ---
+# Bot API limits: ~30 msg/s overall, ~1 msg/s per chat and 20 msg/min per group
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+
+# Priority lanes, lower value is sent first
+PRIORITY_COMMAND = 0
+PRIORITY_ALERT = 1
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens/sec up to `capacity`."""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until one token can be consumed (0 when available now)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds, now):
+        """Stop handing out tokens for `seconds` (used for 429 retry_after)."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+class TelegramDispatcher:
+    """
+    Outbound Telegram queue shared by every sender.
+    Jobs are queued per chat inside priority lanes and handed to a small pool
+    of sender threads, subject to a global bucket and a per-chat bucket.
+    Chats are served round-robin so no single chat floods the global budget,
+    and a 429 pauses only the affected chat for retry_after seconds.
+    """
+
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 group_rate=TELEGRAM_GROUP_RATE, workers=TELEGRAM_SEND_CONCURRENCY):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.workers = workers
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets = {}
+        self._lanes = {PRIORITY_COMMAND: OrderedDict(), PRIORITY_ALERT: OrderedDict()}
+        self._in_flight = set()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self.stats = {'sent': 0, 'failed': 0, 'rate_limited': 0}
+
+    def submit(self, chat_id, method, payload, priority=None):
+        """Queue a Bot API call for `chat_id` and return a Future for its result."""
+        priority = PRIORITY_COMMAND if priority is None else priority
+        future = Future()
+        with self._cond:
+            self._ensure_started()
+            self._lanes[priority].setdefault(chat_id, deque()).append((method, payload, future))
+            self._pending += 1
+            self._cond.notify()
+        return future
+
+    def pending(self):
+        """Number of queued or in-flight calls."""
+        with self._cond:
+            return self._pending
+
+    def join(self, timeout=None):
+        """Block until the queue is drained; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(max(self.workers, 1)):
+            thread = threading.Thread(target=self._run, name=f"telegram-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _bucket_for(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_IDLE_BUCKETS:
+                for idle_chat in [c for c, b in self._chat_buckets.items() if b.is_idle(now)]:
+                    del self._chat_buckets[idle_chat]
+            # Group and channel chat ids are negative
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    def _next_job(self, now):
+        """Pop the next sendable job, or return (None, seconds_to_wait)."""
+        wait = self._global_bucket.delay(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        for lane in self._lanes.values():
+            for chat_id, jobs in lane.items():
+                if chat_id in self._in_flight:
+                    continue
+                bucket = self._bucket_for(chat_id, now)
+                chat_wait = bucket.delay(now)
+                if chat_wait > 0:
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+                    continue
+                job = jobs.popleft()
+                if jobs:
+                    lane.move_to_end(chat_id)
+                else:
+                    del lane[chat_id]
+                bucket.consume(now)
+                self._global_bucket.consume(now)
+                self._in_flight.add(chat_id)
+                return (chat_id, lane, job), None
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    entry, wait = self._next_job(time.monotonic())
+                    if entry is not None:
+                        break
+                    self._cond.wait(wait)
+
+            chat_id, lane, (method, payload, future) = entry
+            try:
+                with UPSTREAM_SECONDS.time('telegram', '', method):
+                    result = call_telegram_api(method, payload)
+            except TelegramRateLimited as e:
+                logger.warning(f"{method} to {chat_id} rate limited, retrying in {e.retry_after}s")
+                with self._cond:
+                    self.stats['rate_limited'] += 1
+                    self._bucket_for(chat_id, time.monotonic()).block(e.retry_after, time.monotonic())
+                    lane.setdefault(chat_id, deque()).appendleft((method, payload, future))
+                    self._in_flight.discard(chat_id)
+                    self._cond.notify_all()
+                continue
+            except Exception as e:
+                logger.error(f"Error calling {method} for {chat_id}: {e}")
+                result = None
+
+            with self._cond:
+                self.stats['sent' if result is not None else 'failed'] += 1
+                self._in_flight.discard(chat_id)
+                self._pending -= 1
+                self._cond.notify_all()
+            if result is not None:
+                logger.info(f"{method} to {chat_id}: Success")
+            future.set_result(result)
+
+telegram_dispatcher = TelegramDispatcher()
+
 # --- Blockchain Interaction Functions ---
-def get_latest_token_purchases(chain, contract_addresses):
+@timed_stage('detection', lambda chain, *args: chain)
+def get_latest_token_purchases(chain, contract_addresses, costs=None, cursors=None):
     """
-    Simulate getting the latest token purchases for a chain and contracts.
-    In a real implementation, this would interact with blockchain APIs.
+    Get the latest token purchases for a chain and contracts.
+    With DATA_SOURCE=rpc, EVM chains are read from Transfer logs and Solana
+    from mint signatures; otherwise purchases are simulated. `costs`, if
+    given, is filled with the RPC requests spent per contract on chains
+    polled per contract. `cursors`, if given, receives the detectors' new
+    cursors instead of them being saved, so the caller can save them once
+    the purchases are journaled.
     """
+    if DATA_SOURCE == 'rpc':
+        if chain == 'SOLANA':
+            return solana_signature_detector.poll(contract_addresses, costs, cursors)
+        return evm_log_detector.poll(chain, contract_addresses, cursors)
+
     purchases = []
     logger.info(f"Simulating purchase detection for {chain} contracts: {contract_addresses}")
 
@@ -136,6 +1189,24 @@ def get_latest_token_purchases(chain, contract_addresses):
     
     return purchases
 
+def polls_per_contract(chain):
+    """
+    Whether polling a chain costs requests per contract. EVM chains read all
+    contracts with one merged eth_getLogs, so skipping some saves nothing.
+    """
+    return DATA_SOURCE != 'rpc' or chain == 'SOLANA'
+
+def call_json_rpc(chain, method, params):
+    """Call a JSON-RPC method on the chain's rpc_url over the shared HTTP client."""
+    payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    with UPSTREAM_SECONDS.time('rpc', chain, method):
+        response = http_client.post(SUPPORTED_CHAINS[chain]['rpc_url'], json=payload, timeout=10)
+        response.raise_for_status()
+        body = response.json()
+    if body.get('error'):
+        raise RuntimeError(f"{chain} RPC {method} failed: {body['error']}")
+    return body.get('result')
+
 def generate_mock_purchase(chain, contract_address):
     """Generate mock purchase data for testing."""
     chain_config = SUPPORTED_CHAINS.get(chain, SUPPORTED_CHAINS['ETH'])
@@ -170,12 +1241,13 @@ def generate_mock_address(chain):
 
 def generate_mock_tx_hash(chain):
     """Generate a mock transaction hash for the given chain."""
+    # Random so mock purchases are distinct to the alert journal's dedupe
     if chain == 'SOLANA':
-        # Solana transaction signatures are typically 88 characters
-        return ''.join([hex(i % 16)[2:] for i in range(88)])
+        # Solana transaction signatures are typically 88 base58 characters
+        return ''.join([random.choice(BASE58_ALPHABET) for _ in range(88)])
     else:
         # Ethereum-style transaction hashes
-        return '0x' + ''.join([hex(i % 16)[2:] for i in range(64)])
+        return '0x' + ''.join([random.choice('0123456789abcdef') for _ in range(64)])
 
 def get_token_price_and_market_cap(token_address, chain):
     """
@@ -186,8 +1258,19 @@ def get_token_price_and_market_cap(token_address, chain):
     
     # Mock data based on contract address hash for consistency
     address_hash = hash(token_address)
+    price_usd = round(0.01 + (address_hash % 1000) / 1000, 4)
+
+    if DATA_SOURCE == 'rpc' and chain != 'SOLANA':
+        # Supply comes from the chain; price still needs a market data API
+        total_supply = erc20_total_supply(chain, token_address)
+        return {
+            'price_usd': price_usd,
+            'market_cap_usd': price_usd * total_supply,
+            'total_supply': total_supply
+        }
+
     return {
-        'price_usd': round(0.01 + (address_hash % 1000) / 1000, 4),
+        'price_usd': price_usd,
         'market_cap_usd': 100000 + (address_hash % 10000000),
         'total_supply': 1000000000 + (address_hash % 1000000000)
     }
@@ -198,14 +1281,1138 @@ def get_wallet_token_balance(wallet_address, token_address, chain):
     This would require a blockchain API (e.g., Alchemy, Moralis).
     """
     logger.info(f"Getting balance for {wallet_address} of token {token_address} on {chain}")
+
+    if DATA_SOURCE == 'rpc' and chain != 'SOLANA':
+        return erc20_balance_of(chain, token_address, wallet_address)
     
     # Mock balance based on wallet and token hash
     balance_hash = hash(wallet_address + token_address)
     return 10000 + (balance_hash % 90000)  # Mock balance between 10k-100k
 
+# --- JSON-RPC Batching ---
+RPC_BATCH_WINDOW_MS = float(os.getenv("RPC_BATCH_WINDOW_MS", "10"))
+RPC_BATCH_MAX_SIZE = int(os.getenv("RPC_BATCH_MAX_SIZE", "50"))
+
+class BatchingRpcClient:
+    """
+    Coalesces JSON-RPC calls into batch requests per chain.
+    Calls submitted within `window_ms` of the first pending one (or until
+    `max_size` calls are pending) go out as one JSON-RPC batch array, and
+    each caller's Future is resolved from the matching response id.
+    """
+
+    def __init__(self, window_ms=RPC_BATCH_WINDOW_MS, max_size=RPC_BATCH_MAX_SIZE, senders=4):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._pending = {}    # chain -> [(method, params, future)]
+        self._deadlines = {}  # chain -> monotonic flush time
+        self._cond = threading.Condition()
+        self._thread = None
+        self._senders = ThreadPoolExecutor(max_workers=senders, thread_name_prefix="rpc-batch")
+        self.stats = {'calls': 0, 'batches': 0}
+
+    def submit(self, chain, method, params):
+        """Queue a call and return a Future for its result."""
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rpc-batcher", daemon=True)
+                self._thread.start()
+            pending = self._pending.setdefault(chain, [])
+            pending.append((method, params, future))
+            if len(pending) == 1:
+                self._deadlines[chain] = time.monotonic() + self.window
+            if len(pending) >= self.max_size:
+                self._deadlines[chain] = 0
+            self._cond.notify()
+        return future
+
+    def call(self, chain, method, params, timeout=30):
+        """Blocking submit()."""
+        return self.submit(chain, method, params).result(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [chain for chain, deadline in self._deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    wait = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._cond.wait(wait)
+                batches = []
+                for chain in due:
+                    del self._deadlines[chain]
+                    batches.append((chain, self._pending.pop(chain)))
+            for chain, entries in batches:
+                self._senders.submit(self._send_batch, chain, entries)
+
+    def _send_batch(self, chain, entries):
+        payload = [
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+            for request_id, (method, params, _) in enumerate(entries)
+        ]
+        with self._cond:
+            self.stats['calls'] += len(entries)
+            self.stats['batches'] += 1
+        try:
+            with UPSTREAM_SECONDS.time('rpc', chain, 'batch'):
+                response = http_client.post(SUPPORTED_CHAINS[chain]['rpc_url'], json=payload, timeout=10)
+                response.raise_for_status()
+                body = response.json()
+            if not isinstance(body, list):
+                raise RuntimeError(f"{chain} RPC rejected batch: {body.get('error', body)}")
+        except Exception as e:
+            for _, _, future in entries:
+                future.set_exception(e)
+            return
+
+        replies = {reply.get('id'): reply for reply in body}
+        for request_id, (method, _, future) in enumerate(entries):
+            reply = replies.get(request_id)
+            if reply is None:
+                future.set_exception(RuntimeError(f"{chain} RPC {method}: missing batch reply"))
+            elif reply.get('error'):
+                future.set_exception(RuntimeError(f"{chain} RPC {method} failed: {reply['error']}"))
+            else:
+                future.set_result(reply.get('result'))
+
+rpc_batcher = BatchingRpcClient()
+
+# ERC-20 selectors used for enrichment lookups
+SELECTOR_TOTAL_SUPPLY = '0x18160ddd'
+SELECTOR_BALANCE_OF = '0x70a08231'
+
+def erc20_call(chain, token_address, data):
+    """Batched eth_call against a token contract, returning the result as an int."""
+    result = rpc_batcher.call(chain, 'eth_call', [{'to': token_address, 'data': data}, 'latest'])
+    return int(result, 16) if result and result != '0x' else 0
+
+def erc20_total_supply(chain, token_address):
+    decimals = get_token_metadata(chain, token_address)['decimals']
+    return erc20_call(chain, token_address, SELECTOR_TOTAL_SUPPLY) / 10 ** decimals
+
+def erc20_balance_of(chain, token_address, wallet_address):
+    decimals = get_token_metadata(chain, token_address)['decimals']
+    data = SELECTOR_BALANCE_OF + wallet_address.lower()[2:].rjust(64, '0')
+    return erc20_call(chain, token_address, data) / 10 ** decimals
+
+# --- EVM Log Detection ---
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+ZERO_ADDRESS = '0x' + '0' * 40
+LOG_MAX_BLOCK_RANGE = int(os.getenv("LOG_MAX_BLOCK_RANGE", "2000"))
+LOG_CONFIRMATIONS = int(os.getenv("LOG_CONFIRMATIONS", "0"))
+
+# ERC-20 function selectors
+SELECTOR_NAME = '0x06fdde03'
+SELECTOR_SYMBOL = '0x95d89b41'
+SELECTOR_DECIMALS = '0x313ce567'
+
+def decode_abi_string(result):
+    """Decode an eth_call result holding an ABI string (or a legacy bytes32)."""
+    raw = bytes.fromhex(result[2:] if result.startswith('0x') else result)
+    if len(raw) == 32:
+        return raw.rstrip(b'\0').decode('utf-8', 'replace')
+    if len(raw) < 64:
+        return ''
+    offset = int.from_bytes(raw[:32], 'big')
+    length = int.from_bytes(raw[offset:offset + 32], 'big')
+    return raw[offset + 32:offset + 32 + length].decode('utf-8', 'replace')
+
+def get_token_metadata(chain, token_address):
+    """
+    Name, symbol and decimals of an ERC-20 token, cached like total_supply.
+    RPC failures raise and cache nothing, since a guessed `decimals` would
+    skew every amount for the cache lifetime; only a token whose answers
+    can't be decoded gets the defaults.
+    """
+    def load():
+        # All three calls share one batch
+        name, symbol, decimals = [
+            rpc_batcher.submit(chain, 'eth_call', [{'to': token_address, 'data': selector}, 'latest'])
+            for selector in (SELECTOR_NAME, SELECTOR_SYMBOL, SELECTOR_DECIMALS)
+        ]
+        results = {
+            'name': (name.result(), decode_abi_string),
+            'symbol': (symbol.result(), decode_abi_string),
+            'decimals': (decimals.result(), lambda result: int(result, 16))
+        }
+        metadata = {'name': 'Unknown Token', 'symbol': 'TOK', 'decimals': 18}
+        for field, (result, decode) in results.items():
+            try:
+                value = decode(result)
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.warning(f"Undecodable {field} for {token_address} on {chain}: {e}")
+                continue
+            if value != '':
+                metadata[field] = value
+        return metadata
+
+    return lookup_cache.get_or_load(('metadata', chain, token_address), load, SUPPLY_CACHE_TTL)
+
+# --- DEX Pool Index ---
+POOL_INDEX_PATH = os.getenv("POOL_INDEX_PATH", os.path.join(DATA_DIR, "buyxanbot_pools.db"))
+
+# Pool-creation events, and which 32-byte data word holds the new pool's address
+PAIR_CREATED_TOPIC = '0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9'  # PairCreated(address,address,address,uint256)
+V3_POOL_CREATED_TOPIC = '0x783cca1c0412dd0d695e784568c96da2e9c22ff989357a2e8b1d9b2b4e6b7118'  # PoolCreated(address,address,uint24,int24,address)
+SOLIDLY_POOL_CREATED_TOPIC = '0x2128d88d14c80cb081c1252a5acff7a264671bf199ce226b53788fb26065005e'  # PoolCreated(address,address,bool,address,uint256)
+POOL_CREATED_TOPICS = {PAIR_CREATED_TOPIC: 0, V3_POOL_CREATED_TOPIC: 1, SOLIDLY_POOL_CREATED_TOPIC: 0}
+
+# Factory lookups
+SELECTOR_GET_PAIR = '0xe6a43905'          # getPair(address,address)
+SELECTOR_GET_POOL_V3 = '0x1698ee82'       # getPool(address,address,uint24)
+SELECTOR_GET_POOL_SOLIDLY = '0x79bc57d5'  # getPool(address,address,bool)
+
+# chain -> factory -> (dex, kind, fee tiers / stable flags)
+DEX_FACTORIES = {
+    'ETH': {
+        '0x5c69bee701ef814a2b6a3edd4b1652cb9cc5aa6f': ('uniswap_v2', 'v2', ()),
+        '0x1f98431c8ad98523631ae4a59f267346ea31f984': ('uniswap_v3', 'v3', (100, 500, 3000, 10000))
+    },
+    'BNB': {
+        '0xca143ce32fe78f1f7019d7d551a6402fc5350c73': ('pancakeswap_v2', 'v2', ()),
+        '0x0bfbcf9fa4f9c56b0f40a671ad40e0805a091865': ('pancakeswap_v3', 'v3', (100, 500, 2500, 10000))
+    },
+    'BASE': {
+        '0x8909dc15e40173ff4699343b6eb8132c65e18ec6': ('uniswap_v2', 'v2', ()),
+        '0x33128a8fc17869897dce68ed026d694621f6fdfd': ('uniswap_v3', 'v3', (100, 500, 3000, 10000)),
+        '0x420dd381b31aef6683db6b902084cb0ffece40da': ('aerodrome', 'solidly', (False, True))
+    }
+}
+
+# Routers that hand bought tokens to the buyer on multi-hop or unwrapping swaps
+DEX_ROUTERS = {
+    'ETH': {
+        '0x7a250d5630b4cf539739df2c5dacb4c659f2488d',  # Uniswap V2 Router02
+        '0x68b3465833fb72a70ecdf485e0e4c7bd8665fc45',  # Uniswap SwapRouter02
+        '0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad'   # Uniswap Universal Router
+    },
+    'BNB': {
+        '0x10ed43c718714eb63d5aa57b78b54704e256024e',  # PancakeSwap V2 Router
+        '0x13f4ea83d0bd40e75c8222255bc855a974568dd4'   # PancakeSwap Smart Router
+    },
+    'BASE': {
+        '0x2626664c2603336e57b271c5c0b26f421741e481',  # Uniswap SwapRouter02
+        '0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad',  # Uniswap Universal Router
+        '0xcf77a3ba9a5ca399b7c97c74d54e5b1beb874e43'   # Aerodrome Router
+    }
+}
+
+# Tokens a watched token is usually paired against
+QUOTE_TOKENS = {
+    'ETH': (
+        '0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2',  # WETH
+        '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48',  # USDC
+        '0xdac17f958d2ee523a2206206994597c13d831ec7'   # USDT
+    ),
+    'BNB': (
+        '0xbb4cdb9cbd36b01bd1cbaebf2de08d9173bc095c',  # WBNB
+        '0x55d398326f99059ff775485246999027b3197955',  # USDT
+        '0xe9e7cea3dedca5984780bafc599bd69add087d56'   # BUSD
+    ),
+    'BASE': (
+        '0x4200000000000000000000000000000000000006',  # WETH
+        '0x833589fcd6edb6e08f4c7c32d4f71b54bda02913'   # USDC
+    )
+}
+
+def _abi_word(value):
+    if isinstance(value, str):
+        return value.lower()[2:].rjust(64, '0')
+    return format(int(value), '064x')
+
+class PoolIndex:
+    """
+    Persisted map of each watched token's DEX pools, so buy classification
+    is a set lookup instead of an RPC call per transfer.
+    A token's pools are looked up once, on first sight, with one batch of
+    factory getPair/getPool calls against the chain's QUOTE_TOKENS. After
+    that, pool-creation logs from DEX_FACTORIES (fetched by the detector in
+    the same eth_getLogs call as the transfers) add new pools as they are
+    created. With POOL_INDEX_PATH empty the index lives in memory only.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS dex_pools (
+            chain TEXT NOT NULL,
+            token_address TEXT NOT NULL,
+            pool_address TEXT NOT NULL,
+            dex TEXT NOT NULL,
+            PRIMARY KEY (chain, token_address, pool_address)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS dex_pool_tokens (
+            chain TEXT NOT NULL,
+            token_address TEXT NOT NULL,
+            indexed_at REAL NOT NULL,
+            PRIMARY KEY (chain, token_address)
+        ) WITHOUT ROWID"""
+    )
+
+    def __init__(self, path=POOL_INDEX_PATH):
+        self.path = path
+        self.db = None
+        self.pools = {}    # chain -> {(token_address, pool_address)}
+        self.pooled = {}   # chain -> tokens with at least one known pool
+        self.indexed = {}  # chain -> tokens whose pools have been looked up
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {'indexed': 0, 'lookups': 0, 'pools': 0, 'discovered': 0}
+
+    def _load(self):
+        # Opened on first use so importing the module creates no files
+        with self._lock:
+            if self._loaded:
+                return
+            if self.path:
+                self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                if self.path != ':memory:':
+                    self.db.execute("PRAGMA journal_mode=WAL")
+                for statement in self.SCHEMA:
+                    self.db.execute(statement)
+                for chain, token_address in self.db.execute("SELECT chain, token_address FROM dex_pool_tokens"):
+                    self.indexed.setdefault(chain, set()).add(token_address)
+                for chain, token_address, pool_address in self.db.execute(
+                        "SELECT chain, token_address, pool_address FROM dex_pools"):
+                    self.pools.setdefault(chain, set()).add((token_address, pool_address))
+                    self.pooled.setdefault(chain, set()).add(token_address)
+            self._loaded = True
+
+    def has_pools(self, chain, token_address):
+        if not self._loaded:
+            self._load()
+        return token_address in self.pooled.get(chain, ())
+
+    def is_indexed(self, chain, token_address):
+        """Whether the token's pools have been looked up (successfully, even if none were found)."""
+        if not self._loaded:
+            self._load()
+        return token_address in self.indexed.get(chain, ())
+
+    def is_venue(self, chain, token_address, address):
+        """Whether `address` is one of the token's pools or a known router."""
+        return (token_address, address) in self.pools.get(chain, ()) or address in DEX_ROUTERS.get(chain, ())
+
+    @staticmethod
+    def factory_addresses(chain):
+        return list(DEX_FACTORIES.get(chain, ()))
+
+    @staticmethod
+    def _lookup_calls(kind, token_address, quote, params):
+        if kind == 'v2':
+            return [SELECTOR_GET_PAIR + _abi_word(token_address) + _abi_word(quote)]
+        selector = SELECTOR_GET_POOL_V3 if kind == 'v3' else SELECTOR_GET_POOL_SOLIDLY
+        return [selector + _abi_word(token_address) + _abi_word(quote) + _abi_word(param) for param in params]
+
+    def ensure(self, chain, token_addresses):
+        """Look up the pools of any token not indexed yet, in one RPC batch."""
+        if not self._loaded:
+            self._load()
+        factories = DEX_FACTORIES.get(chain)
+        indexed = self.indexed.get(chain, set())
+        missing = [token_address for token_address in token_addresses if token_address not in indexed]
+        if not factories or not missing:
+            return
+
+        lookups = []
+        for token_address in missing:
+            for quote in QUOTE_TOKENS.get(chain, ()):
+                if quote == token_address:
+                    continue
+                for factory, (dex, kind, params) in factories.items():
+                    for data in self._lookup_calls(kind, token_address, quote, params):
+                        lookups.append((token_address, dex, rpc_batcher.submit(
+                            chain, 'eth_call', [{'to': factory, 'data': data}, 'latest']
+                        )))
+        self.stats['lookups'] += len(lookups)
+
+        found, failed = [], set()
+        for token_address, dex, future in lookups:
+            try:
+                result = future.result() or '0x'
+            except (ValueError, RuntimeError) + HTTP_ERRORS as e:
+                if token_address not in failed:
+                    logger.warning(f"Pool lookup failed for {token_address} on {chain}: {e}")
+                failed.add(token_address)
+                continue
+            pool_address = '0x' + result[2:].rjust(40, '0')[-40:].lower()
+            if pool_address != ZERO_ADDRESS:
+                found.append((token_address, pool_address, dex))
+
+        # Tokens with a failed lookup are retried on their next poll
+        self._add(chain, found, [token_address for token_address in missing if token_address not in failed])
+
+    def observe(self, chain, log):
+        """Index a pool-creation log if it pairs an indexed token. Returns those tokens."""
+        topics = log.get('topics', [])
+        word = POOL_CREATED_TOPICS.get(topics[0]) if len(topics) >= 3 else None
+        factory = DEX_FACTORIES.get(chain, {}).get(log.get('address', '').lower())
+        if word is None or factory is None:
+            return []
+        data = (log.get('data') or '0x')[2:]
+        pool_address = '0x' + data[64 * word + 24:64 * word + 64].lower()
+        indexed = self.indexed.get(chain, ())
+        tokens = [
+            token_address for token_address in ('0x' + topics[1][-40:].lower(), '0x' + topics[2][-40:].lower())
+            if token_address in indexed
+        ]
+        if tokens:
+            self._add(chain, [(token_address, pool_address, factory[0]) for token_address in tokens], [])
+            self.stats['discovered'] += len(tokens)
+        return tokens
+
+    def _add(self, chain, pools, indexed_tokens):
+        if not self._loaded:
+            self._load()
+        with self._lock:
+            for token_address, pool_address, _ in pools:
+                self.pools.setdefault(chain, set()).add((token_address, pool_address))
+                self.pooled.setdefault(chain, set()).add(token_address)
+            self.indexed.setdefault(chain, set()).update(indexed_tokens)
+            self.stats['pools'] = sum(len(chain_pools) for chain_pools in self.pools.values())
+            self.stats['indexed'] += len(indexed_tokens)
+            if self.db is None:
+                return
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO dex_pools (chain, token_address, pool_address, dex) VALUES (?, ?, ?, ?)",
+                [(chain, token_address, pool_address, dex) for token_address, pool_address, dex in pools]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO dex_pool_tokens (chain, token_address, indexed_at) VALUES (?, ?, ?)",
+                [(chain, token_address, time.time()) for token_address in indexed_tokens]
+            )
+            self.db.execute("COMMIT")
+
+pool_index = PoolIndex()
+
+class EvmLogPurchaseDetector:
+    """
+    Detects purchases on EVM chains from ERC-20 Transfer logs, classified
+    as buys against the PoolIndex.
+    Each watched contract has a persisted last-processed-block cursor.
+    Contracts whose cursors fall within one max_block_range window (normally
+    every contract on the chain) are fetched with one eth_getLogs call from
+    the oldest of them, and each log is kept only if it is past its own
+    contract's cursor. Work per cycle therefore grows with new blocks, not
+    with history. A contract seen for the first time starts at the current
+    head; one whose pool lookup failed keeps its cursor until the lookup
+    succeeds. The same call also returns the DEX factories' pool-creation
+    logs, which keep the index current.
+    """
+
+    def __init__(self, store=None, index=None, max_block_range=LOG_MAX_BLOCK_RANGE, confirmations=LOG_CONFIRMATIONS):
+        self.store = store
+        self.index = index
+        self.max_block_range = max_block_range
+        self.confirmations = confirmations
+
+    def _store(self):
+        return self.store or config_store
+
+    def _index(self):
+        return self.index or pool_index
+
+    @staticmethod
+    def cursor_key(chain, contract_address):
+        return f"evm:{chain}:{contract_address}"
+
+    def is_buy(self, chain, token_address, sender, recipient):
+        """
+        Whether a transfer is a purchase: the token leaves one of its pools (or
+        a router) for an address that isn't one. Transfers of tokens with no
+        indexed pool can't be told apart from sells or wallet moves, so they
+        are counted in UNCLASSIFIED_TRANSFERS and not alerted.
+        """
+        if sender == ZERO_ADDRESS or recipient == ZERO_ADDRESS:
+            return False
+        index = self._index()
+        if not index.has_pools(chain, token_address):
+            UNCLASSIFIED_TRANSFERS.inc(chain)
+            logger.debug(f"Unclassified transfer of {token_address} on {chain}: no indexed pool")
+            return False
+        return index.is_venue(chain, token_address, sender) and not index.is_venue(chain, token_address, recipient)
+
+    def poll(self, chain, contract_addresses, cursors=None):
+        """
+        Return purchases in blocks after each contract's cursor and advance the
+        cursors, or add the new cursors to `cursors` for the caller to save.
+        """
+        if not contract_addresses:
+            return []
+        store = self._store()
+        index = self._index()
+        index.ensure(chain, contract_addresses)
+        factories = index.factory_addresses(chain)
+        head = int(call_json_rpc(chain, 'eth_blockNumber', []), 16) - self.confirmations
+
+        # First block each contract still needs
+        starts = {}
+        new_cursors = {}
+        for contract_address in contract_addresses:
+            cursor = store.get_cursor(self.cursor_key(chain, contract_address))
+            if cursor is None:
+                new_cursors[self.cursor_key(chain, contract_address)] = head
+            elif int(cursor) < head:
+                if factories and not index.is_indexed(chain, contract_address):
+                    continue  # Transfers can't be classified yet; retried after the pool lookup succeeds
+                starts[contract_address] = int(cursor) + 1
+
+        purchases = []
+        for from_block, to_block, contracts in self._windows(starts, head):
+            logs = call_json_rpc(chain, 'eth_getLogs', [{
+                'fromBlock': hex(from_block),
+                'toBlock': hex(to_block),
+                'address': contracts + factories,
+                'topics': [[TRANSFER_TOPIC, *POOL_CREATED_TOPICS]]
+            }])
+            # New pools first, so buys from them in the same blocks classify
+            for log in logs:
+                if (log.get('topics') or [None])[0] in POOL_CREATED_TOPICS:
+                    for token in index.observe(chain, log):
+                        poll_scheduler.wake(chain, token)
+            for log in logs:
+                token_address = log['address'].lower()
+                # Drop factory logs and logs a contract processed before the window's start caught up
+                if token_address not in starts or int(log.get('blockNumber', '0x0'), 16) < starts[token_address]:
+                    continue
+                purchase = self.decode_transfer(chain, log)
+                if purchase is not None:
+                    purchases.append(purchase)
+            for contract_address in contracts:
+                new_cursors[self.cursor_key(chain, contract_address)] = to_block
+
+        if cursors is None:
+            store.set_cursors(new_cursors)
+        else:
+            cursors.update(new_cursors)
+        return purchases
+
+    def _windows(self, starts, head):
+        """
+        Merge contracts into (from_block, to_block, contracts) windows: each
+        window starts at its oldest contract's first block and takes every
+        contract that starts within max_block_range of it.
+        """
+        pending = sorted(starts.items(), key=lambda item: item[1])
+        windows = []
+        while pending:
+            from_block = pending[0][1]
+            to_block = min(head, from_block + self.max_block_range - 1)
+            contracts = [contract for contract, start in pending if start <= to_block]
+            windows.append((from_block, to_block, contracts))
+            pending = pending[len(contracts):]
+        return windows
+
+    def decode_transfer(self, chain, log):
+        """Decode a Transfer log into the purchase dict, or None if it is not a buy."""
+        topics = log.get('topics', [])
+        if len(topics) < 3 or topics[0] != TRANSFER_TOPIC:
+            return None
+        token_address = log['address'].lower()
+        sender = '0x' + topics[1][-40:].lower()
+        recipient = '0x' + topics[2][-40:].lower()
+        if not self.is_buy(chain, token_address, sender, recipient):
+            return None
+
+        metadata = get_token_metadata(chain, token_address)
+        raw_amount = int(log.get('data') or '0x0', 16)
+        return {
+            'token_name': metadata['name'],
+            'token_symbol': metadata['symbol'],
+            'token_address': token_address,
+            'chain': chain,
+            # Not in the Transfer log, estimated from the token price at enrichment
+            'native_amount': None,
+            'token_amount': raw_amount / 10 ** metadata['decimals'],
+            'buyer_address': recipient,
+            'txn_hash': log.get('transactionHash', 'N/A'),
+            'block_number': int(log.get('blockNumber', '0x0'), 16),
+            'timestamp': datetime.now().timestamp()
+        }
+
+evm_log_detector = EvmLogPurchaseDetector()
+
+# --- Solana Signature Detection ---
+SOLANA_SIGNATURE_PAGE_SIZE = int(os.getenv("SOLANA_SIGNATURE_PAGE_SIZE", "1000"))
+SOLANA_MAX_PAGES = int(os.getenv("SOLANA_MAX_PAGES", "5"))
+SOLANA_COMMITMENT = os.getenv("SOLANA_COMMITMENT", "confirmed")
+SOLANA_POOL_CACHE_TTL = float(os.getenv("SOLANA_POOL_CACHE_TTL", "3600"))
+SOLANA_MAX_POOLS = int(os.getenv("SOLANA_MAX_POOLS", "5"))
+
+WRAPPED_SOL_MINT = 'So11111111111111111111111111111111111111112'
+LAMPORTS_PER_SOL = 10 ** 9
+
+# Raydium AMM v4 pool state (LIQUIDITY_STATE_LAYOUT_V4): account size and mint offsets
+RAYDIUM_AMM_V4_PROGRAM_ID = '675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8'
+RAYDIUM_AMM_V4_STATE_SIZE = 752
+RAYDIUM_AMM_V4_MINT_OFFSETS = (400, 432)  # base mint, quote mint
+
+# Swap programs whose transactions can be buys
+DEX_PROGRAM_IDS = {
+    'JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4',   # Jupiter v6
+    'JUP4Fb2cqiRUcaTHdrPC8h2gNsA2ETXiPDD33WcGuJB',   # Jupiter v4
+    RAYDIUM_AMM_V4_PROGRAM_ID,                        # Raydium AMM v4
+    'CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK',  # Raydium CLMM
+    'CPMMoo8L3F4NbTegBCKVNunggL7H1ZpdTHKxQB5qKP1C'   # Raydium CPMM
+}
+
+def get_solana_token_metadata(mint):
+    """
+    Name and symbol of an SPL token via the DAS getAsset method (Helius),
+    cached like ERC-20 metadata. On an RPC failure the alert still goes out
+    under the defaults, but they aren't cached, so the next buy asks again.
+    """
+    def load():
+        asset = rpc_batcher.call('SOLANA', 'getAsset', {'id': mint}) or {}
+        content = asset.get('content', {}).get('metadata', {})
+        return {'name': content.get('name') or 'Unknown Token', 'symbol': content.get('symbol') or 'TOK'}
+
+    try:
+        return lookup_cache.get_or_load(('metadata', 'SOLANA', mint), load, SUPPLY_CACHE_TTL)
+    except (ValueError, RuntimeError) + HTTP_ERRORS as e:
+        logger.warning(f"Incomplete metadata for {mint} on SOLANA: {e}")
+        return {'name': 'Unknown Token', 'symbol': 'TOK'}
+
+class SolanaSignaturePurchaseDetector:
+    """
+    Detects purchases of SPL mints from their transaction signatures.
+    Signatures are read from the mint and from its Raydium AMM v4 pools:
+    v4 swaps reference the pool and its vaults but not the mint, so the mint
+    alone misses them. Each of those addresses has a persisted cursor
+    holding the newest signature already processed. A cycle sends one batch
+    of getSignaturesForAddress calls (`until` the cursor, paging with
+    `before` only for busy addresses), then one batch of getTransaction
+    calls for all new signatures. Buys are decoded from the pre/post token
+    balance arrays of Jupiter/Raydium transactions, so each transaction
+    costs no extra RPC calls. An address seen for the first time starts at
+    its newest signature. stats['buys_without_mint'] counts the buys the
+    mint's own signatures would have missed.
+    """
+
+    def __init__(self, store=None, page_size=SOLANA_SIGNATURE_PAGE_SIZE, max_pages=SOLANA_MAX_PAGES,
+                 commitment=SOLANA_COMMITMENT, max_pools=SOLANA_MAX_POOLS):
+        self.store = store
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.commitment = commitment
+        self.max_pools = max_pools
+        self.stats = {'pool_lookups': 0, 'buys': 0, 'buys_without_mint': 0}
+
+    def _store(self):
+        return self.store or config_store
+
+    @staticmethod
+    def cursor_key(mint, address=None):
+        if address is None or address == mint:
+            return f"solana:{mint}"
+        return f"solana:{mint}:{address}"
+
+    def _pool_lookup(self, mint):
+        self.stats['pool_lookups'] += 1
+        return [
+            rpc_batcher.submit('SOLANA', 'getProgramAccounts', [RAYDIUM_AMM_V4_PROGRAM_ID, {
+                'encoding': 'base64',
+                'commitment': self.commitment,
+                'dataSlice': {'offset': 0, 'length': 0},
+                'filters': [{'dataSize': RAYDIUM_AMM_V4_STATE_SIZE}, {'memcmp': {'offset': offset, 'bytes': mint}}]
+            }])
+            for offset in RAYDIUM_AMM_V4_MINT_OFFSETS
+        ]
+
+    def pool_addresses(self, mints):
+        """Each mint's Raydium AMM v4 pools, looked up with getProgramAccounts and cached."""
+        # Every uncached mint's lookups go into the same batch before any is awaited
+        submitted = {
+            mint: self._pool_lookup(mint)
+            for mint in mints if lookup_cache.get(('raydium_pools', mint)) is None
+        }
+
+        def load(mint):
+            futures = submitted.get(mint) or self._pool_lookup(mint)
+            pools = sorted({account['pubkey'] for future in futures for account in future.result() or []})
+            if len(pools) > self.max_pools:
+                logger.warning(f"{mint}: {len(pools)} Raydium AMM v4 pools, watching the first {self.max_pools}")
+            return pools[:self.max_pools]
+
+        pools = {}
+        for mint in mints:
+            try:
+                pools[mint] = lookup_cache.get_or_load(('raydium_pools', mint), lambda: load(mint), SOLANA_POOL_CACHE_TTL)
+            except (RuntimeError,) + HTTP_ERRORS as e:
+                # Not cached, so the lookup is retried on the next poll
+                logger.warning(f"Raydium pool lookup failed for {mint}: {e}")
+                pools[mint] = []
+        return pools
+
+    def _signatures_page(self, address, until, before=None, limit=None):
+        options = {'limit': limit or self.page_size, 'commitment': self.commitment}
+        if until:
+            options['until'] = until
+        if before:
+            options['before'] = before
+        return rpc_batcher.submit('SOLANA', 'getSignaturesForAddress', [address, options])
+
+    def poll(self, mints, costs=None, cursors=None):
+        """
+        Return purchases in signatures newer than each mint's cursor and
+        advance the cursors, or add the new cursors to `cursors` for the
+        caller to save. `costs`, if given, gets each mint's RPC requests.
+        """
+        if not mints:
+            return []
+        store = self._store()
+        costs = {} if costs is None else costs
+        pools = self.pool_addresses(mints)
+        sources = [(mint, address) for mint in mints for address in [mint, *pools[mint]]]
+        for mint in mints:
+            costs[mint] = 0
+
+        # First page for every address in one batch; new addresses just fetch their newest signature
+        last_seen = {source: store.get_cursor(self.cursor_key(*source)) for source in sources}
+        pages = {
+            source: self._signatures_page(source[1], cursor, limit=None if cursor else 1)
+            for source, cursor in last_seen.items()
+        }
+
+        new_cursors = {}
+        signatures = []  # (mint, signature), oldest first per address
+        seen = set()     # a swap can reference both the mint and a pool
+        for (mint, address), future in pages.items():
+            costs[mint] += 1
+            try:
+                page = future.result()
+            except (RuntimeError,) + HTTP_ERRORS as e:
+                logger.error(f"getSignaturesForAddress failed for {address}: {e}")
+                continue
+            if not page:
+                continue
+            key = self.cursor_key(mint, address)
+            if last_seen[(mint, address)] is None:
+                new_cursors[key] = page[0]['signature']
+                continue
+            try:
+                entries = self._remaining_pages(mint, address, last_seen[(mint, address)], page, costs)
+            except (RuntimeError,) + HTTP_ERRORS as e:
+                # Cursor left where it was, so the whole range is retried next cycle
+                logger.error(f"getSignaturesForAddress paging failed for {address}: {e}")
+                continue
+            new_cursors[key] = page[0]['signature']
+            for entry in reversed(entries):
+                if entry.get('err') is None and (mint, entry['signature']) not in seen:
+                    seen.add((mint, entry['signature']))
+                    signatures.append((mint, entry['signature']))
+                    costs[mint] += 1
+
+        transactions = [self._transaction(signature) for _, signature in signatures]
+        purchases = []
+        for (mint, signature), future in zip(signatures, transactions):
+            try:
+                transaction = future.result()
+            except (RuntimeError,) + HTTP_ERRORS as e:
+                logger.error(f"getTransaction failed for {signature}: {e}")
+                continue
+            purchase = self.decode_swap(mint, signature, transaction)
+            if purchase is not None:
+                purchases.append(purchase)
+
+        if cursors is None:
+            store.set_cursors(new_cursors)
+        else:
+            cursors.update(new_cursors)
+        return purchases
+
+    def _transaction(self, signature):
+        return rpc_batcher.submit('SOLANA', 'getTransaction', [signature, {
+            'encoding': 'json',
+            'commitment': self.commitment,
+            'maxSupportedTransactionVersion': 0
+        }])
+
+    def fetch(self, mint, signature):
+        """Decode one known signature (e.g. from a stream notification) into a purchase, or None."""
+        return self.decode_swap(mint, signature, self._transaction(signature).result())
+
+    def _remaining_pages(self, mint, address, until, page, costs):
+        """Follow `before` while pages come back full, up to max_pages."""
+        entries = list(page)
+        pages = 1
+        while len(page) >= self.page_size:
+            if pages >= self.max_pages:
+                logger.warning(f"{address}: more than {len(entries)} new signatures, skipping older ones")
+                break
+            costs[mint] += 1
+            page = self._signatures_page(address, until, before=page[-1]['signature']).result()
+            entries.extend(page)
+            pages += 1
+        return entries
+
+    @staticmethod
+    def _account_keys(transaction):
+        keys = list(transaction['transaction']['message']['accountKeys'])
+        loaded = (transaction.get('meta') or {}).get('loadedAddresses') or {}
+        # Versioned transactions append lookup-table accounts: writable, then readonly
+        return keys + loaded.get('writable', []) + loaded.get('readonly', [])
+
+    def is_swap(self, transaction, account_keys):
+        """Whether a transaction invokes a known DEX program, at top level or via CPI."""
+        instructions = list(transaction['transaction']['message'].get('instructions', []))
+        for inner in (transaction.get('meta') or {}).get('innerInstructions') or []:
+            instructions.extend(inner.get('instructions', []))
+        return any(
+            account_keys[instruction['programIdIndex']] in DEX_PROGRAM_IDS
+            for instruction in instructions
+            if instruction.get('programIdIndex', len(account_keys)) < len(account_keys)
+        )
+
+    @staticmethod
+    def _token_deltas(meta, owner):
+        """Raw token balance change per mint for `owner`, with each mint's decimals."""
+        deltas = {}
+        for sign, key in ((-1, 'preTokenBalances'), (1, 'postTokenBalances')):
+            for balance in meta.get(key) or []:
+                if balance.get('owner') != owner:
+                    continue
+                amount = balance['uiTokenAmount']
+                delta, _ = deltas.get(balance['mint'], (0, amount['decimals']))
+                deltas[balance['mint']] = (delta + sign * int(amount['amount']), amount['decimals'])
+        return deltas
+
+    def decode_swap(self, mint, signature, transaction):
+        """Decode a swap transaction into the purchase dict, or None if it isn't a buy of `mint`."""
+        if not transaction:
+            return None
+        meta = transaction.get('meta')
+        if not meta or meta.get('err') is not None:
+            return None
+        account_keys = self._account_keys(transaction)
+        if not self.is_swap(transaction, account_keys):
+            return None
+
+        # The fee payer is the trader; it's a buy if their balance of the mint went up
+        buyer = account_keys[0]
+        deltas = self._token_deltas(meta, buyer)
+        bought, decimals = deltas.get(mint, (0, 0))
+        if bought <= 0:
+            return None
+        self.stats['buys'] += 1
+        if mint not in account_keys:
+            self.stats['buys_without_mint'] += 1
+
+        # SOL spent: lamports (net of the fee) plus any pre-wrapped SOL
+        lamports_spent = meta['preBalances'][0] - meta['postBalances'][0] - meta.get('fee', 0)
+        wsol_spent = -deltas.get(WRAPPED_SOL_MINT, (0, 9))[0]
+        native_spent = (max(lamports_spent, 0) + max(wsol_spent, 0)) / LAMPORTS_PER_SOL
+
+        metadata = get_solana_token_metadata(mint)
+        return {
+            'token_name': metadata['name'],
+            'token_symbol': metadata['symbol'],
+            'token_address': mint,
+            'chain': 'SOLANA',
+            # Paid in another token (e.g. USDC): estimated from the token price at enrichment
+            'native_amount': native_spent or None,
+            'token_amount': bought / 10 ** decimals,
+            'buyer_address': buyer,
+            'txn_hash': signature,
+            'block_number': transaction.get('slot'),
+            'timestamp': transaction.get('blockTime') or datetime.now().timestamp()
+        }
+
+solana_signature_detector = SolanaSignaturePurchaseDetector()
+
+# --- Lookup Cache ---
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "15"))
+SUPPLY_CACHE_TTL = float(os.getenv("SUPPLY_CACHE_TTL", "3600"))
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "5"))
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "10000"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-key TTLs and LRU eviction.
+    Concurrent misses on the same key are coalesced so only one caller runs
+    the upstream loader and the rest wait for its result.
+    """
+
+    def __init__(self, maxsize=LOOKUP_CACHE_SIZE, default_ttl=60):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _backend_get(self, key):
+        """Return (found, value) for a live entry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def _backend_set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, default=None):
+        found, value = self._backend_get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value if found else default
+
+    def set(self, key, value, ttl=None):
+        self._backend_set(key, value, self.default_ttl if ttl is None else ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` once on a miss."""
+        found, value = self._backend_get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.loads += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+            self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'size': len(self._data)
+            }
+
+class RedisCache(TTLCache):
+    """TTLCache variant storing entries in Redis (or any client with get/set px)."""
+
+    def __init__(self, client, prefix="buyxanbot:cache:", default_ttl=60):
+        super().__init__(maxsize=0, default_ttl=default_ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def _redis_key(self, key):
+        return self.prefix + json.dumps(key, separators=(',', ':'))
+
+    def _backend_get(self, key):
+        raw = self.client.get(self._redis_key(key))
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    def _backend_set(self, key, value, ttl):
+        self.client.set(self._redis_key(key), json.dumps(value), px=max(int(ttl * 1000), 1))
+
+def create_lookup_cache():
+    """Use Redis when REDIS_URL is set and redis-py is installed, else in-process."""
+    if REDIS_URL:
+        if redis is not None:
+            return RedisCache(redis.Redis.from_url(REDIS_URL))
+        logger.warning("REDIS_URL is set but redis is not installed, using in-process cache")
+    return TTLCache()
+
+lookup_cache = create_lookup_cache()
+
+def get_cached_token_info(token_address, chain):
+    """
+    Cached get_token_price_and_market_cap.
+    Price and market cap expire after PRICE_CACHE_TTL, total_supply after
+    SUPPLY_CACHE_TTL.
+    """
+    supply_key = ('supply', chain, token_address)
+
+    def load_market():
+        info = get_token_price_and_market_cap(token_address, chain)
+        lookup_cache.set(supply_key, info.get('total_supply', 0), SUPPLY_CACHE_TTL)
+        return {'price_usd': info.get('price_usd', 0), 'market_cap_usd': info.get('market_cap_usd', 0)}
+
+    market = lookup_cache.get_or_load(('price', chain, token_address), load_market, PRICE_CACHE_TTL)
+    total_supply = lookup_cache.get_or_load(
+        supply_key,
+        lambda: get_token_price_and_market_cap(token_address, chain).get('total_supply', 0),
+        SUPPLY_CACHE_TTL
+    )
+    return dict(market, total_supply=total_supply)
+
+def get_cached_wallet_balance(wallet_address, token_address, chain):
+    """Cached get_wallet_token_balance, expiring after BALANCE_CACHE_TTL."""
+    return lookup_cache.get_or_load(
+        ('balance', chain, token_address, wallet_address),
+        lambda: get_wallet_token_balance(wallet_address, token_address, chain),
+        BALANCE_CACHE_TTL
+    )
+
+# --- Native Price Feed ---
+PRICE_FEED_URL = os.getenv("PRICE_FEED_URL", "https://api.coingecko.com/api/v3/simple/price")
+PRICE_FEED_INTERVAL = float(os.getenv("PRICE_FEED_INTERVAL", "30"))
+PRICE_FEED_MAX_AGE = float(os.getenv("PRICE_FEED_MAX_AGE", "300"))
+
+class NativePriceFeed:
+    """
+    Background refresher for the native coin price of every supported chain.
+    All chains are fetched in one batched request and published as an
+    immutable snapshot that is swapped in a single assignment, so readers
+    never lock and never touch the network. On failure the last-known
+    prices stay in place and the snapshot is reported as stale.
+    """
+
+    def __init__(self, url=PRICE_FEED_URL, interval=PRICE_FEED_INTERVAL, max_age=PRICE_FEED_MAX_AGE):
+        self.url = url
+        self.interval = interval
+        self.max_age = max_age
+        # (prices by chain, monotonic time of the last successful refresh)
+        self._snapshot = (
+            {chain: config['native_price'] for chain, config in SUPPORTED_CHAINS.items()},
+            None
+        )
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stale_logged = False
+
+    def refresh(self):
+        """Fetch all native prices in one request; returns True on success."""
+        ids = sorted({config['price_id'] for config in SUPPORTED_CHAINS.values()})
+        try:
+            with UPSTREAM_SECONDS.time('price_feed', '', 'refresh'):
+                response = http_client.get(self.url, params={'ids': ','.join(ids), 'vs_currencies': 'usd'})
+                response.raise_for_status()
+                quotes = response.json()
+        except (ValueError,) + HTTP_ERRORS as e:
+            logger.warning(f"Native price refresh failed, keeping last-known prices: {e}")
+            self._check_staleness()
+            return False
+
+        prices = dict(self._snapshot[0])
+        for chain, config in SUPPORTED_CHAINS.items():
+            usd = quotes.get(config['price_id'], {}).get('usd')
+            if isinstance(usd, (int, float)) and usd > 0:
+                prices[chain] = usd
+        self._snapshot = (prices, time.monotonic())
+        self._stale_logged = False
+        return True
+
+    def _check_staleness(self):
+        if self.is_stale() and not self._stale_logged:
+            age = self.age()
+            since = "never refreshed" if age is None else f"age: {age}s"
+            logger.warning(f"Native prices are stale ({since}), using last-known values")
+            self._stale_logged = True
+
+    def age(self):
+        """Seconds since the last successful refresh, or None if never refreshed."""
+        fetched_at = self._snapshot[1]
+        return None if fetched_at is None else round(time.monotonic() - fetched_at, 1)
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.max_age
+
+    def get_price(self, chain):
+        """O(1) read of the current USD price for `chain`'s native coin."""
+        prices = self._snapshot[0]
+        return prices.get(chain, prices['ETH'])
+
+    def start(self):
+        """Start the refresh thread (idempotent)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="native-price-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+native_price_feed = NativePriceFeed()
+
 # --- Message Formatting ---
-def format_purchase_message(purchase_data, config):
-    """Format purchase data into a rich HTML Telegram message."""
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "4096"))
+ALERT_FOOTER = "🔹 <a href='https://t.me/buyxanbot'>Join Community</a>"
+
+# Pre-rendered fragments of an alert that only depend on the token
+TokenTemplate = namedtuple('TokenTemplate', ['header', 'native_unit', 'buyer_prefix', 'txn_prefix', 'footer'])
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_token_template(chain, token_address, token_name, token_symbol):
+    """
+    Render the per-token parts of a buy alert once (header, explorer URLs, links, footer).
+    Name and symbol come from the token contract, so they are HTML-escaped.
+    """
+    token_name = html.escape(token_name)
+    token_symbol = html.escape(token_symbol)
+    chain_config = SUPPORTED_CHAINS.get(chain, SUPPORTED_CHAINS['ETH'])
+    explorer_url = chain_config['explorer']
+    chart_link = build_chart_link(chain, token_address)
+    trade_link = build_trade_link(chain, token_address)
+    return TokenTemplate(
+        header=f"<b>{token_name}</b> ({token_symbol}) Buy!\n\n",
+        native_unit=f" {chain_config['symbol']} ($",
+        buyer_prefix=f" {token_symbol}\n🔷 <a href='{explorer_url}/address/",
+        txn_prefix=f"</a> | Txn <a href='{explorer_url}/tx/",
+        footer=(
+            f"\n\n📊 <a href='{chart_link}'>Chart</a>\n"
+            f"🦄 <a href='{trade_link}'>Trade</a>\n"
+            f"{ALERT_FOOTER}"
+        )
+    )
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def render_emoji_bar(custom_emoji, emoji_count):
+    """Per-chat emoji bar, cached by (emoji, count)."""
+    return custom_emoji * emoji_count
+
+def enrich_purchase(purchase_data):
+    """
+    Chat-independent alert stage, run once per purchase.
+    Does the price/market cap/balance lookups and renders everything in the
+    alert except the chat's emoji bar.
+    """
     token_name = purchase_data.get('token_name', 'Unknown Token')
     token_symbol = purchase_data.get('token_symbol', 'TOK')
     chain = purchase_data.get('chain', 'ETH')
@@ -216,50 +2423,85 @@ def format_purchase_message(purchase_data, config):
     token_address = purchase_data.get('token_address', 'N/A')
 
     # Get additional token information
-    token_info = get_token_price_and_market_cap(token_address, chain)
-    price_usd = token_info.get('price_usd', 0)
+    token_info = get_cached_token_info(token_address, chain)
     market_cap_usd = token_info.get('market_cap_usd', 0)
     total_supply = token_info.get('total_supply', 0)
+    native_price = native_price_feed.get_price(chain)
+
+    # Log-detected purchases carry no native amount; estimate it from the token price
+    if native_amount is None:
+        native_amount = token_amount * token_info.get('price_usd', 0) / native_price
+
+    # Calculate USD value
+    usd_value = native_amount * native_price
+
+    # Calculate wallet position
+    wallet_balance = get_cached_wallet_balance(buyer_address, token_address, chain)
+    position_percent = (wallet_balance / total_supply) * 100 if total_supply > 0 else 0
+
+    # Format addresses for display
+    short_buyer = f"{buyer_address[:6]}...{buyer_address[-4:]}" if len(buyer_address) > 10 else buyer_address
+
+    # Fill the pre-rendered token template in a single join
+    template = get_token_template(chain, token_address, token_name, token_symbol)
+    body = "".join((
+        "\n\n💵 ", f"{native_amount:.3f}", template.native_unit, f"{usd_value:,.2f}",
+        ")\n🪙 ", f"{token_amount:,.0f}",
+        template.buyer_prefix, buyer_address, "'>", short_buyer,
+        template.txn_prefix, txn_hash,
+        "'>🔗</a>\n🔼 Position +", f"{position_percent:.1f}",
+        "%\n🔼 Market Cap $", f"{market_cap_usd:,.0f}",
+        template.footer
+    ))
+
+    return {
+        'purchase': purchase_data,
+        'native_amount': native_amount,
+        'usd_value': usd_value,
+        'emoji_count': min(max(int(usd_value / 100), 1), 20),  # 1-20 emojis based on USD value
+        'position_percent': position_percent,
+        'market_cap_usd': market_cap_usd,
+        'header': template.header,
+        'body': body
+    }
 
-    # Get chain configuration
+# Timed for the monitor pipeline only; formatting paths call enrich_purchase untimed
+timed_enrich_purchase = timed_stage('enrichment', lambda purchase_data: purchase_data.get('chain', 'ETH'))(enrich_purchase)
+
+def render_purchase_alert(enriched, config):
+    """Per-chat alert stage: splice the chat's emoji bar into an enriched purchase."""
+    emojis = render_emoji_bar(config.get('custom_emoji', '🟢'), enriched['emoji_count'])
+    return "".join((enriched['header'], emojis, enriched['body']))
+
+def render_purchase_summary(summary, config):
+    """Render one alert summarising several coalesced buys of a token for a chat."""
+    purchase = summary['largest']['purchase']
+    chain = purchase.get('chain', 'ETH')
+    token_name = purchase.get('token_name', 'Unknown Token')
+    token_symbol = purchase.get('token_symbol', 'TOK')
+    buyer_address = purchase.get('buyer_address', 'N/A')
+    short_buyer = f"{buyer_address[:6]}...{buyer_address[-4:]}" if len(buyer_address) > 10 else buyer_address
+    template = get_token_template(chain, purchase.get('token_address', 'N/A'), token_name, token_symbol)
     chain_config = SUPPORTED_CHAINS.get(chain, SUPPORTED_CHAINS['ETH'])
-    native_symbol = chain_config['symbol']
     explorer_url = chain_config['explorer']
-    native_price = chain_config['native_price']
-    
-    # Calculate USD value
-    usd_value = native_amount * native_price
 
-    # Custom emojis based on purchase size
-    custom_emoji = config.get('custom_emoji', '🟢')
-    emoji_count = min(max(int(usd_value / 100), 1), 20)  # 1-20 emojis based on USD value
-    emojis = custom_emoji * emoji_count
-
-    # Calculate wallet position
-    wallet_balance = get_wallet_token_balance(buyer_address, token_address, chain)
-    position_percent = (wallet_balance / total_supply) * 100 if total_supply > 0 else 0
+    emoji_count = min(max(int(summary['usd_value'] / 100), 1), 20)
+    emojis = render_emoji_bar(config.get('custom_emoji', '🟢'), emoji_count)
 
-    # Format addresses for display
-    short_buyer = f"{buyer_address[:6]}...{buyer_address[-4:]}" if len(buyer_address) > 10 else buyer_address
-    
-    # Build chart and trade links
-    chart_link = build_chart_link(chain, token_address)
-    trade_link = build_trade_link(chain, token_address)
+    return "".join((
+        f"<b>{html.escape(token_name)}</b> ({html.escape(token_symbol)}) {summary['count']} Buys!\n\n",
+        emojis,
+        "\n\n💵 ", f"{summary['native_amount']:.3f}", template.native_unit, f"{summary['usd_value']:,.2f}",
+        ")\n🪙 ", f"{summary['token_amount']:,.0f}", f" {html.escape(token_symbol)}",
+        f"\n🐋 Top buyer <a href='{explorer_url}/address/{buyer_address}'>{short_buyer}</a>",
+        f" ({summary['largest']['native_amount']:.3f} {chain_config['symbol']})",
+        "\n🔼 Market Cap $", f"{summary['market_cap_usd']:,.0f}",
+        template.footer
+    ))
 
-    # Construct the message
-    message = f"<b>{token_name}</b> ({token_symbol}) Buy!\n\n"
-    message += f"{emojis}\n\n"
-    message += f"💵 {native_amount:.3f} {native_symbol} (${usd_value:,.2f})\n"
-    message += f"🪙 {token_amount:,.0f} {token_symbol}\n"
-    message += f"🔷 <a href='{explorer_url}/address/{buyer_address}'>{short_buyer}</a> | "
-    message += f"Txn <a href='{explorer_url}/tx/{txn_hash}'>🔗</a>\n"
-    message += f"🔼 Position +{position_percent:.1f}%\n"
-    message += f"🔼 Market Cap ${market_cap_usd:,.0f}\n\n"
-    message += f"📊 <a href='{chart_link}'>Chart</a>\n"
-    message += f"🦄 <a href='{trade_link}'>Trade</a>\n"
-    message += "🔹 <a href='https://t.me/buyxanbot'>Join Community</a>"
-
-    return message
+def format_purchase_message(purchase_data, config):
+    """Format purchase data into a rich HTML Telegram message."""
+    return render_purchase_alert(enrich_purchase(purchase_data), config)
 
 def build_chart_link(chain, token_address):
     """Build chart link for the token."""
@@ -297,6 +2539,7 @@ Soy tu bot de detección de compras de tokens multi-cadena. Puedo monitorizar co
 • /listtokens - Mostrar todos los tokens monitorizados
 • /setgif [URL] - Establecer GIF personalizado para alertas
 • /setemoji [EMOJI] - Establecer emoji personalizado
+• /setminbuy [USD] - Ignorar compras por debajo de este valor
 • /help - Mostrar esta ayuda
 
 <b>🔗 Cadenas soportadas:</b>
@@ -309,6 +2552,7 @@ Soy tu bot de detección de compras de tokens multi-cadena. Puedo monitorizar co
 <code>/addtoken ETH 0x1234567890abcdef1234567890abcdef12345678</code>
 <code>/setgif https://media.giphy.com/media/your-gif.gif</code>
 <code>/setemoji 💰</code>
+<code>/setminbuy 50</code>
 
 ¡Listo para empezar a monitorizar! 🎯
 """
@@ -316,12 +2560,7 @@ Soy tu bot de detección de compras de tokens multi-cadena. Puedo monitorizar co
     send_telegram_message(chat_id, welcome_message)
     
     # Initialize bot configuration if it doesn't exist
-    if chat_id not in bot_configs:
-        bot_configs[chat_id] = {
-            'watched_tokens': {'ETH': [], 'SOLANA': [], 'BNB': [], 'BASE': []},
-            'custom_gif_url': None,
-            'custom_emoji': '🟢'
-        }
+    config_store.ensure_chat(chat_id)
 
 def handle_addtoken_command(chat_id, args):
     """Handle the /addtoken command."""
@@ -343,16 +2582,16 @@ def handle_addtoken_command(chat_id, args):
         )
         return
 
-    # Initialize config if needed
-    if chat_id not in bot_configs:
-        bot_configs[chat_id] = {
-            'watched_tokens': {'ETH': [], 'SOLANA': [], 'BNB': [], 'BASE': []},
-            'custom_gif_url': None,
-            'custom_emoji': '🟢'
-        }
+    try:
+        token_key = normalize_token_address(chain, contract_address)
+    except ValueError:
+        send_telegram_message(chat_id, 
+            f"❌ <b>Dirección de contrato no válida para {chain}:</b>\n"
+            f"<code>{contract_address}</code>"
+        )
+        return
 
-    if contract_address not in bot_configs[chat_id]['watched_tokens'][chain]:
-        bot_configs[chat_id]['watched_tokens'][chain].append(contract_address)
+    if config_store.add_token(chat_id, chain, token_key, contract_address):
         send_telegram_message(chat_id, 
             f"✅ <b>¡Token añadido exitosamente!</b>\n\n"
             f"🔗 Cadena: <b>{chain}</b>\n"
@@ -385,15 +2624,19 @@ def handle_removetoken_command(chat_id, args):
         )
         return
 
-    if (chat_id not in bot_configs or 
-        contract_address not in bot_configs[chat_id]['watched_tokens'].get(chain, [])):
+    try:
+        token_key = normalize_token_address(chain, contract_address)
+    except ValueError:
+        # Entries stored before addresses were validated can still be removed verbatim
+        token_key = contract_address
+
+    if not config_store.remove_token(chat_id, chain, token_key):
         send_telegram_message(chat_id, 
             f"⚠️ <b>Token no encontrado</b>\n\n"
             f"Este token no está siendo monitorizado en {chain}."
         )
         return
 
-    bot_configs[chat_id]['watched_tokens'][chain].remove(contract_address)
     send_telegram_message(chat_id, 
         f"✅ <b>¡Token eliminado exitosamente!</b>\n\n"
         f"🔗 Cadena: <b>{chain}</b>\n"
@@ -427,7 +2670,7 @@ def handle_listtokens_command(chat_id):
     for chain, tokens in watched_tokens.items():
         if tokens:
             message += f"🔗 <b>{chain}:</b>\n"
-            for token in tokens:
+            for token in tokens.values():
                 message += f"  • <code>{token}</code>\n"
             message += "\n"
     
@@ -445,15 +2688,7 @@ def handle_setgif_command(chat_id, args):
         return
 
     gif_url = args[0]
-    
-    if chat_id not in bot_configs:
-        bot_configs[chat_id] = {
-            'watched_tokens': {'ETH': [], 'SOLANA': [], 'BNB': [], 'BASE': []},
-            'custom_gif_url': None,
-            'custom_emoji': '🟢'
-        }
-    
-    bot_configs[chat_id]['custom_gif_url'] = gif_url
+    config_store.set_gif(chat_id, gif_url)
     send_telegram_message(chat_id, 
         f"✅ <b>¡GIF personalizado establecido exitosamente!</b>\n\n"
         f"🎬 URL del GIF: <a href='{gif_url}'>Vista previa</a>\n\n"
@@ -471,59 +2706,113 @@ def handle_setemoji_command(chat_id, args):
         return
 
     emoji = args[0]
-    
-    if chat_id not in bot_configs:
-        bot_configs[chat_id] = {
-            'watched_tokens': {'ETH': [], 'SOLANA': [], 'BNB': [], 'BASE': []},
-            'custom_gif_url': None,
-            'custom_emoji': '🟢'
-        }
-    
-    bot_configs[chat_id]['custom_emoji'] = emoji
+    config_store.set_emoji(chat_id, emoji)
     send_telegram_message(chat_id, 
         f"✅ <b>¡Emoji personalizado establecido exitosamente!</b>\n\n"
         f"😊 Emoji: {emoji}\n\n"
         "¡Este emoji se usará en las alertas de compra! 🎯"
     )
 
+def handle_setminbuy_command(chat_id, args):
+    """Handle the /setminbuy command."""
+    try:
+        min_buy_usd = float(args[0].lstrip("$").replace(",", "")) if len(args) == 1 else -1
+    except ValueError:
+        min_buy_usd = -1
+    if not 0 <= min_buy_usd < math.inf:
+        send_telegram_message(chat_id, 
+            "❌ <b>Uso incorrecto.</b>\n\n"
+            "Uso: <code>/setminbuy [USD]</code>\n"
+            "Ejemplo: <code>/setminbuy 50</code>\n"
+            "Usa <code>/setminbuy 0</code> para recibir todas las compras."
+        )
+        return
+
+    config_store.set_min_buy(chat_id, min_buy_usd)
+    if min_buy_usd == 0:
+        send_telegram_message(chat_id, 
+            "✅ <b>¡Compra mínima desactivada!</b>\n\n"
+            "Recibirás alertas de todas las compras. 🎯"
+        )
+        return
+    send_telegram_message(chat_id, 
+        f"✅ <b>¡Compra mínima establecida exitosamente!</b>\n\n"
+        f"💵 Mínimo: <b>${min_buy_usd:,.2f}</b>\n\n"
+        "Las compras por debajo de este valor no se alertarán. 🎯"
+    )
+
 # --- Main Webhook Handler ---
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "").lstrip("@").lower()
+WEBHOOK_LOG_SAMPLE_EVERY = int(os.getenv("WEBHOOK_LOG_SAMPLE_EVERY", "1000"))  # 0 disables sampling
+
+COMMAND_HANDLERS = {
+    '/start': lambda chat_id, args: handle_start_command(chat_id),
+    '/help': lambda chat_id, args: handle_start_command(chat_id),
+    '/addtoken': handle_addtoken_command,
+    '/removetoken': handle_removetoken_command,
+    '/listtokens': lambda chat_id, args: handle_listtokens_command(chat_id),
+    '/setgif': handle_setgif_command,
+    '/setemoji': handle_setemoji_command,
+    '/setminbuy': handle_setminbuy_command
+}
+
+# A command is a message whose text starts with "/" (possibly JSON-escaped).
+# Raw bodies without one are acknowledged without being parsed.
+COMMAND_PREFILTER_RE = re.compile(rb'"text"\s*:\s*"(?:/|\\/|\\u002[fF])')
+
+# Parsed updates, for log sampling; incremented from every webhook worker thread
+_webhook_updates_seen = 0
+_webhook_updates_lock = threading.Lock()
+
+def parse_command(text):
+    """
+    Split "/cmd@BotName arg1 arg2" into ("/cmd", [args]).
+    Returns (None, []) for commands addressed to a different bot.
+    """
+    command_parts = text.split(" ", 1)
+    command, _, bot_name = command_parts[0].lower().partition("@")
+    if bot_name and TELEGRAM_BOT_USERNAME and bot_name != TELEGRAM_BOT_USERNAME:
+        return None, []
+    args = command_parts[1].split(" ") if len(command_parts) > 1 else []
+    return command, args
+
 def handle_telegram_webhook(request_body):
     """
     Process incoming Telegram updates (webhooks).
     This would be the main entry point for your serverless function.
     """
+    global _webhook_updates_seen
     try:
-        if isinstance(request_body, str):
-            update = json.loads(request_body)
+        if isinstance(request_body, (str, bytes)):
+            raw = request_body.encode() if isinstance(request_body, str) else request_body
+            if not COMMAND_PREFILTER_RE.search(raw):
+                return {"statusCode": 200, "body": "OK"}
+            update = json.loads(raw)
         else:
             update = request_body
-            
-        logger.info(f"Telegram update received: {update}")
 
-        if "message" in update:
-            message = update["message"]
-            chat_id = message["chat"]["id"]
+        with _webhook_updates_lock:
+            _webhook_updates_seen += 1
+            seen = _webhook_updates_seen
+        if WEBHOOK_LOG_SAMPLE_EVERY and seen % WEBHOOK_LOG_SAMPLE_EVERY == 1:
+            logger.info("Telegram update received (1 in %d sampled): %s", WEBHOOK_LOG_SAMPLE_EVERY, update)
+        else:
+            logger.debug("Telegram update received: %s", update)
+
+        message = update.get("message")
+        if message:
             text = message.get("text", "")
 
             if text.startswith("/"):
-                # Parse command and arguments
-                command_parts = text.split(" ", 1)
-                command = command_parts[0].lower()
-                args = command_parts[1].split(" ") if len(command_parts) > 1 else []
-
-                # Route to appropriate handler
-                if command in ["/start", "/help"]:
-                    handle_start_command(chat_id)
-                elif command == "/addtoken":
-                    handle_addtoken_command(chat_id, args)
-                elif command == "/removetoken":
-                    handle_removetoken_command(chat_id, args)
-                elif command == "/listtokens":
-                    handle_listtokens_command(chat_id)
-                elif command == "/setgif":
-                    handle_setgif_command(chat_id, args)
-                elif command == "/setemoji":
-                    handle_setemoji_command(chat_id, args)
+                chat_id = message["chat"]["id"]
+                command, args = parse_command(text)
+                if command is None:
+                    return {"statusCode": 200, "body": "OK"}
+
+                handler = COMMAND_HANDLERS.get(command)
+                if handler:
+                    with STAGE_SECONDS.time('command', ''):
+                        handler(chat_id, args)
                 else:
                     send_telegram_message(chat_id, 
                         "❌ Comando desconocido. Usa /help para ver los comandos disponibles."
@@ -534,39 +2823,1406 @@ def handle_telegram_webhook(request_body):
         logger.error(f"Error in handle_telegram_webhook: {e}")
         return {"statusCode": 500, "body": f"Internal server error: {e}"}
 
+# --- Webhook Ingestion Server ---
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/api/telegram/webhook")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+PROFILER_PATH = os.getenv("PROFILER_PATH", "/debug/profiler")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", "100000"))
+
+# update_id is read straight from the raw body so it can be deduped without parsing
+UPDATE_ID_RE = re.compile(rb'"update_id"\s*:\s*(\d+)')
+
+class WebhookIngest:
+    """
+    Non-blocking front end for Telegram webhook deliveries.
+    The ASGI endpoint checks the secret token, enqueues the raw update and
+    acks immediately; a bounded pool of worker threads then runs
+    handle_telegram_webhook. Redelivered update_ids are acked without being
+    processed twice. When the queue is full the update is refused with 503
+    so Telegram retries it later, and the refusal is counted under
+    'backpressure' instead of the update being dropped.
+    """
+
+    def __init__(self, queue_size=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS,
+                 dedupe_size=WEBHOOK_DEDUPE_SIZE, secret_token=TELEGRAM_WEBHOOK_SECRET):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.dedupe_size = dedupe_size
+        self.secret_token = secret_token
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.stats = {
+            'received': 0,
+            'enqueued': 0,
+            'duplicates': 0,
+            'unauthorized': 0,
+            'backpressure': 0,
+            'processed': 0,
+            'failed': 0,
+            'max_queue_depth': 0
+        }
+
+    def start(self):
+        """Start the worker pool (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(max(self.workers, 1)):
+                thread = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def accept(self, body):
+        """Enqueue a raw update; returns the HTTP status to answer Telegram with."""
+        self.start()
+        match = UPDATE_ID_RE.search(body)
+        update_id = int(match.group(1)) if match else None
+        with self._lock:
+            self.stats['received'] += 1
+            if update_id is not None and update_id in self._seen:
+                self.stats['duplicates'] += 1
+                return 200
+            try:
+                self.queue.put_nowait(body)
+            except queue.Full:
+                self.stats['backpressure'] += 1
+                return 503
+            self.stats['enqueued'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.queue.qsize())
+            if update_id is not None:
+                self._seen[update_id] = None
+                if len(self._seen) > self.dedupe_size:
+                    self._seen.popitem(last=False)
+        return 200
+
+    def authorized(self, headers, require_secret=False):
+        if not self.secret_token:
+            return not require_secret
+        supplied = headers.get(b'x-telegram-bot-api-secret-token', b'')
+        return hmac.compare_digest(supplied, self.secret_token.encode())
+
+    def _run(self):
+        while True:
+            body = self.queue.get()
+            try:
+                result = handle_telegram_webhook(body)
+                failed = result.get('statusCode') != 200
+            except Exception as e:
+                logger.error(f"Webhook worker failed: {e}")
+                failed = True
+            with self._lock:
+                self.stats['failed' if failed else 'processed'] += 1
+            self.queue.task_done()
+
+    async def __call__(self, scope, receive, send):
+        """ASGI entry point."""
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    self.start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        path, method = scope['path'], scope['method']
+        if path == METRICS_PATH and method == 'GET':
+            await _asgi_respond(send, 200, metrics.render().encode(), content_type=b'text/plain; version=0.0.4')
+            return
+        if path.startswith(PROFILER_PATH):
+            await self._profiler_endpoint(scope, send)
+            return
+        if path != WEBHOOK_PATH or method != 'POST':
+            await _asgi_respond(send, 404, b'Not Found')
+            return
+        if not self.authorized(dict(scope['headers'])):
+            with self._lock:
+                self.stats['unauthorized'] += 1
+            await _asgi_respond(send, 401, b'Unauthorized')
+            return
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        status = self.accept(b''.join(chunks))
+        if status == 503:
+            await _asgi_respond(send, 503, b'Busy', [(b'retry-after', b'1')])
+        else:
+            await _asgi_respond(send, status, b'OK')
+
+    async def _profiler_endpoint(self, scope, send):
+        """
+        GET  {PROFILER_PATH}        collapsed stacks collected so far
+        POST {PROFILER_PATH}/start  start (or keep) sampling
+        POST {PROFILER_PATH}/stop   stop sampling
+        POST {PROFILER_PATH}/reset  drop collected stacks
+        Guarded by the webhook secret token, and closed when none is set.
+        """
+        if not self.authorized(dict(scope['headers']), require_secret=True):
+            await _asgi_respond(send, 401, b'Unauthorized')
+            return
+        action = scope['path'][len(PROFILER_PATH):].strip('/')
+        if scope['method'] == 'GET' and not action:
+            await _asgi_respond(send, 200, sampling_profiler.collapsed().encode())
+            return
+        actions = {'start': sampling_profiler.start, 'stop': sampling_profiler.stop, 'reset': sampling_profiler.reset}
+        if scope['method'] != 'POST' or action not in actions:
+            await _asgi_respond(send, 404, b'Not Found')
+            return
+        # stop() waits for the sampler thread to exit: keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, actions[action])
+        await _asgi_respond(send, 200, f"profiler running: {sampling_profiler.running}".encode())
+
+async def _asgi_respond(send, status, body, headers=(), content_type=b'text/plain'):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode()), *headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+webhook_ingest = WebhookIngest()
+
+# Scrape-time exports; lambdas so swapped singletons (e.g. in the load simulation) are picked up
+metrics.gauge('telegram_queue_depth', 'Telegram calls queued or in flight.', lambda: telegram_dispatcher.pending())
+metrics.gauge('webhook_queue_depth', 'Webhook updates waiting for a worker.', lambda: webhook_ingest.queue.qsize())
+metrics.gauge('watched_tokens', 'Distinct watched (chain, token) pairs.', lambda: len(config_store.subscriptions))
+metrics.gauge('chats', 'Chats with a config.', lambda: len(bot_configs))
+metrics.gauge('profiler_running', 'Whether the sampling profiler is on.', lambda: int(sampling_profiler.running))
+metrics.add_stats('telegram', lambda: telegram_dispatcher.stats)
+metrics.add_stats('webhook', lambda: webhook_ingest.stats, gauges=('max_queue_depth',))
+metrics.add_stats('lookup_cache', lambda: lookup_cache.stats(), gauges=('size',))
+metrics.add_stats('rpc_batcher', lambda: rpc_batcher.stats)
+metrics.add_stats('alert_coalescer', lambda: alert_coalescer.stats)
+metrics.add_stats('alert_journal', lambda: alert_journal.stats)
+metrics.add_stats('poll_scheduler', lambda: poll_scheduler.stats)
+metrics.add_stats('pool_index', lambda: pool_index.stats, gauges=('pools',))
+metrics.add_stats('solana_detector', lambda: solana_signature_detector.stats)
+metrics.add_stats('http_client', lambda: http_client.pool_stats(), label='host')
+
+# ASGI application, e.g. `uvicorn app:asgi_app`
+asgi_app = webhook_ingest
+
+# --- Alert Journal ---
+ALERT_JOURNAL_PATH = os.getenv("ALERT_JOURNAL_PATH", os.path.join(DATA_DIR, "buyxanbot_alerts.db"))  # empty disables
+ALERT_JOURNAL_CAPACITY = int(os.getenv("ALERT_JOURNAL_CAPACITY", "5000000"))
+ALERT_JOURNAL_RETENTION = float(os.getenv("ALERT_JOURNAL_RETENTION", str(7 * 24 * 3600)))
+ALERT_JOURNAL_COMPACT_INTERVAL = float(os.getenv("ALERT_JOURNAL_COMPACT_INTERVAL", "3600"))
+ALERT_REPLAY_MAX_AGE = float(os.getenv("ALERT_REPLAY_MAX_AGE", "3600"))
+
+class BloomFilter:
+    """Fixed-size bloom filter over bytes keys, sized for `capacity` keys at `error_rate`."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.num_hashes = max(round(self.num_bits / max(capacity, 1) * math.log(2)), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class AlertJournal:
+    """
+    SQLite journal of per-chat alert delivery, keyed by (chat_id, txn_hash, token).
+    An entry is claimed as pending before the alert is queued and marked
+    delivered when Telegram accepts it, so after a crash pending entries are
+    replayed and delivered ones are never re-alerted. Dedupe checks hit a
+    bloom filter first; only its positives (duplicates plus ~1% false
+    positives) read SQLite, and its size is fixed by ALERT_JOURNAL_CAPACITY.
+    Compaction drops entries older than ALERT_JOURNAL_RETENTION and rebuilds
+    the filter.
+    """
+
+    PENDING, DELIVERED, EXPIRED = 0, 1, 2
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS alert_journal (
+            chat_id INTEGER NOT NULL,
+            txn_hash TEXT NOT NULL,
+            token_address TEXT NOT NULL,
+            chain TEXT NOT NULL,
+            state INTEGER NOT NULL,
+            purchase TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, txn_hash, token_address)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS alert_journal_pending ON alert_journal (created_at) WHERE state = 0",
+        "CREATE INDEX IF NOT EXISTS alert_journal_created ON alert_journal (created_at)"
+    )
+
+    def __init__(self, path=ALERT_JOURNAL_PATH, capacity=ALERT_JOURNAL_CAPACITY,
+                 retention=ALERT_JOURNAL_RETENTION, compact_interval=ALERT_JOURNAL_COMPACT_INTERVAL):
+        self.path = path
+        self.capacity = capacity
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.db = None
+        self.bloom = None
+        self._lock = threading.Lock()
+        self._replayed = False
+        self._deferred = []  # (deferred_at, purchase, chat_ids) whose enrichment failed
+        self._last_compaction = time.monotonic()
+        self.stats = {'claimed': 0, 'duplicates': 0, 'bloom_positives': 0, 'delivered': 0, 'replayed': 0,
+                      'deferred': 0}
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        # Opened on first use so importing the module creates no files
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            if self.path != ':memory:':
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+            self._rebuild_bloom()
+        return self.db
+
+    def _rebuild_bloom(self):
+        bloom = BloomFilter(self.capacity)
+        for chat_id, txn_hash, token_address in self.db.execute(
+                "SELECT chat_id, txn_hash, token_address FROM alert_journal"):
+            bloom.add(self._key(chat_id, txn_hash, token_address))
+        self.bloom = bloom
+
+    @staticmethod
+    def _key(chat_id, txn_hash, token_address):
+        return f"{chat_id}:{token_address}:{txn_hash}".encode()
+
+    def claim(self, purchase, chat_ids):
+        """
+        Record `purchase` as pending for each chat that hasn't had it yet, in one
+        transaction. Returns the chat_ids that should be alerted.
+        """
+        txn_hash = purchase.get('txn_hash')
+        if not self.enabled or not txn_hash:
+            return list(chat_ids)
+        token_address = purchase.get('token_address')
+        payload = json.dumps(purchase)
+        now = time.time()
+        claimed = []
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            try:
+                for chat_id in chat_ids:
+                    key = self._key(chat_id, txn_hash, token_address)
+                    if key in self.bloom:
+                        self.stats['bloom_positives'] += 1
+                        if db.execute(
+                                "SELECT 1 FROM alert_journal WHERE chat_id = ? AND txn_hash = ? AND token_address = ?",
+                                (chat_id, txn_hash, token_address)).fetchone():
+                            self.stats['duplicates'] += 1
+                            continue
+                    inserted = db.execute(
+                        "INSERT OR IGNORE INTO alert_journal "
+                        "(chat_id, txn_hash, token_address, chain, state, purchase, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (chat_id, txn_hash, token_address, purchase.get('chain', 'ETH'),
+                         self.PENDING, payload, now)
+                    ).rowcount == 1
+                    self.bloom.add(key)
+                    if not inserted:
+                        # Claimed by another process since this one's bloom filter was built
+                        self.stats['duplicates'] += 1
+                        continue
+                    claimed.append(chat_id)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            self.stats['claimed'] += len(claimed)
+        return claimed
+
+    def mark_delivered(self, chat_id, purchases):
+        if not self.enabled:
+            return
+        rows = [(self.DELIVERED, chat_id, p.get('txn_hash'), p.get('token_address')) for p in purchases]
+        with self._lock:
+            self._connect().executemany(
+                "UPDATE alert_journal SET state = ? WHERE chat_id = ? AND txn_hash = ? AND token_address = ?",
+                rows
+            )
+            self.stats['delivered'] += len(rows)
+
+    def track(self, future, chat_id, purchases):
+        """
+        Mark `purchases` delivered to `chat_id` once `future` succeeds; returns
+        `future`. Failed sends stay pending and are replayed on restart.
+        """
+        if self.enabled and future is not None:
+            def on_done(done):
+                if telegram_call_succeeded(done):
+                    self.mark_delivered(chat_id, purchases)
+            future.add_done_callback(on_done)
+        return future
+
+    def defer(self, purchase, chat_ids):
+        """Hold claimed alerts whose enrichment failed; replay_pending retries them."""
+        with self._lock:
+            self._deferred.append((time.time(), purchase, list(chat_ids)))
+            self.stats['deferred'] += 1
+
+    def _retry_deferred(self):
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        cutoff = time.time() - ALERT_REPLAY_MAX_AGE
+        retried = 0
+        for deferred_at, purchase, chat_ids in deferred:
+            try:
+                enriched = enrich_purchase(purchase)
+            except Exception as e:
+                if deferred_at < cutoff:
+                    logger.warning(f"Giving up on alert for {purchase.get('txn_hash')}: {e}")
+                else:
+                    with self._lock:
+                        self._deferred.append((deferred_at, purchase, chat_ids))
+                continue
+            for chat_id in chat_ids:
+                config = bot_configs.get(chat_id)
+                if config is not None:
+                    alert_coalescer.submit(chat_id, config, enriched)
+                    retried += 1
+        return retried
+
+    def replay_pending(self, owns=None):
+        """
+        Retry deferred alerts, and re-alert entries left pending by a previous
+        process (once per process). Entries older than ALERT_REPLAY_MAX_AGE
+        are expired instead of sent.
+        """
+        retried = self._retry_deferred()
+        if retried:
+            logger.info(f"Retried {retried} deferred alerts")
+            self.stats['replayed'] += retried
+        if not self.enabled or self._replayed:
+            return retried
+        self._replayed = True
+        cutoff = time.time() - ALERT_REPLAY_MAX_AGE
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE alert_journal SET state = ? WHERE state = ? AND created_at < ?",
+                       (self.EXPIRED, self.PENDING, cutoff))
+            pending = db.execute(
+                "SELECT chat_id, chain, token_address, purchase FROM alert_journal "
+                "WHERE state = ? ORDER BY created_at", (self.PENDING,)
+            ).fetchall()
+
+        replayed = 0
+        for chat_id, chain, token_address, payload in pending:
+            config = bot_configs.get(chat_id)
+            if config is None or (owns is not None and not owns(chain, token_address)):
+                continue
+            try:
+                alert_coalescer.submit(chat_id, config, enrich_purchase(json.loads(payload)))
+                replayed += 1
+            except Exception as e:
+                logger.error(f"Error replaying alert for chat {chat_id}: {e}")
+        if replayed:
+            logger.info(f"Replayed {replayed} pending alerts from the journal")
+        self.stats['replayed'] += replayed
+        return retried + replayed
+
+    def compact(self):
+        """Drop entries past the retention period and rebuild the bloom filter."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            db = self._connect()
+            deleted = db.execute("DELETE FROM alert_journal WHERE created_at < ?", (cutoff,)).rowcount
+            self._rebuild_bloom()
+            if self.path != ':memory:':
+                db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._last_compaction = time.monotonic()
+        logger.info(f"Alert journal compacted: {deleted} entries removed")
+        return deleted
+
+    def maybe_compact(self):
+        if self.enabled and time.monotonic() - self._last_compaction >= self.compact_interval:
+            self.compact()
+
+alert_journal = AlertJournal()
+
+# --- Alert Delivery ---
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "16"))
+enrichment_executor = ThreadPoolExecutor(max_workers=ENRICHMENT_WORKERS, thread_name_prefix="enrich")
+
+ALERT_GIF_CAPTION = os.getenv("ALERT_GIF_CAPTION", "false").lower() in ("1", "true", "yes")
+TELEGRAM_CAPTION_LIMIT = 1024
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+def caption_length(html_text):
+    """Length Telegram checks against the caption limit: visible text in UTF-16 units."""
+    return len(html.unescape(HTML_TAG_RE.sub('', html_text)).encode('utf-16-le')) // 2
+
+def send_chat_gif(chat_id, config, caption=None):
+    """
+    Queue the chat's custom GIF, optionally with an HTML caption, and return its Future.
+    The cached Telegram file_id for the URL is sent when there is one. The
+    first send by URL caches the file_id Telegram returns for every chat using
+    that URL; a failed send by file_id drops it so the next alert falls back
+    to the URL.
+    """
+    gif_url = config['custom_gif_url']
+    file_id = config_store.get_gif_file_id(gif_url)
+    future = send_telegram_animation(chat_id, file_id or gif_url, caption=caption,
+                                     priority=PRIORITY_ALERT, wait=False)
+
+    def update_file_id(done):
+        if not telegram_call_succeeded(done):
+            if file_id:
+                config_store.set_gif_file_id(gif_url, None, replaces=file_id)
+            return
+        if not file_id:
+            message = done.result().get('result') or {}
+            # GIFs come back as 'animation', some other files as 'document'
+            media = message.get('animation') or message.get('document') or {}
+            if media.get('file_id'):
+                config_store.set_gif_file_id(gif_url, media['file_id'])
+
+    future.add_done_callback(update_file_id)
+    return future
+
+def send_alert_message(chat_id, config, message, gif=True):
+    """
+    Queue an alert, preceded by the chat's GIF (if configured and `gif`).
+    With ALERT_GIF_CAPTION the two go out as one captioned sendAnimation,
+    unless the alert is over Telegram's caption limit.
+    Returns the Future of the call carrying the alert text.
+    """
+    if gif and config.get('custom_gif_url'):
+        if ALERT_GIF_CAPTION and caption_length(message) <= TELEGRAM_CAPTION_LIMIT:
+            return send_chat_gif(chat_id, config, caption=message)
+        send_chat_gif(chat_id, config)
+    return send_telegram_message(chat_id, message, priority=PRIORITY_ALERT, wait=False)
+
+def send_purchase_alert(chat_id, config, enriched, gif=True):
+    """
+    Queue the chat's GIF (if configured and `gif`) and rendered alert for an
+    enriched purchase. Returns the Future of the alert message.
+    """
+    ALERTS_SENT.inc(enriched['purchase'].get('chain', 'ETH'), 'single')
+    return send_alert_message(chat_id, config, render_purchase_alert(enriched, config), gif)
+
+ALERT_COALESCE_WINDOW = float(os.getenv("ALERT_COALESCE_WINDOW", "30"))  # seconds, 0 disables
+ALERT_WHALE_USD = float(os.getenv("ALERT_WHALE_USD", "10000"))
+ALERT_BACKLOG_LIMIT = int(os.getenv("ALERT_BACKLOG_LIMIT", "5000"))
+
+class AlertCoalescer:
+    """
+    Coalesces buy alerts per (chat, chain, token).
+    The first buy of a window is alerted straight away; later buys in the
+    window are folded into a running summary (count, totals, largest buyer)
+    that is sent when the window closes and opens the next one. The chat's
+    GIF goes out at most once per window, and buys worth `whale_usd` or more
+    are always alerted individually. Each key holds one aggregate (plus the
+    purchases it covers, for the alert journal), and summaries wait while the
+    Telegram queue is over `backlog_limit`, so a spike grows the aggregate
+    instead of the send backlog.
+    """
+
+    def __init__(self, window=ALERT_COALESCE_WINDOW, whale_usd=ALERT_WHALE_USD,
+                 backlog_limit=ALERT_BACKLOG_LIMIT):
+        self.window = window
+        self.whale_usd = whale_usd
+        self.backlog_limit = backlog_limit
+        self._windows = {}  # (chat_id, chain, token) -> {'opened', 'gif_at', 'config', 'summary'}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {'immediate': 0, 'whales': 0, 'coalesced': 0, 'summaries': 0, 'gifs': 0, 'deferred': 0}
+
+    def start(self):
+        """Start the window flush thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="alert-coalescer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(min(self.window / 4, 1.0)):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Alert coalescer flush failed: {e}")
+
+    def submit(self, chat_id, config, enriched):
+        """
+        Alert or coalesce one enriched purchase for one chat.
+        Returns the alert's Future, or None if it was folded into a summary.
+        """
+        if self.window <= 0:
+            return alert_journal.track(send_purchase_alert(chat_id, config, enriched),
+                                       chat_id, [enriched['purchase']])
+        self.start()
+
+        purchase = enriched['purchase']
+        key = (chat_id, purchase.get('chain', 'ETH'), purchase.get('token_address'))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None:
+                state = self._windows[key] = {'opened': now, 'gif_at': None, 'config': config, 'summary': None}
+            elif now - state['opened'] >= self.window and state['summary'] is None:
+                state['opened'] = now
+            elif enriched['usd_value'] < self.whale_usd:
+                state['config'] = config
+                self._fold(state, enriched)
+                self.stats['coalesced'] += 1
+                return None
+
+            self.stats['whales' if enriched['usd_value'] >= self.whale_usd else 'immediate'] += 1
+            gif = self._take_gif(state, config, now)
+        return alert_journal.track(send_purchase_alert(chat_id, config, enriched, gif=gif),
+                                   chat_id, [purchase])
+
+    def _fold(self, state, enriched):
+        summary = state['summary']
+        if summary is None:
+            summary = state['summary'] = {
+                'count': 0, 'native_amount': 0.0, 'usd_value': 0.0, 'token_amount': 0.0,
+                'largest': enriched, 'market_cap_usd': 0, 'purchases': []
+            }
+        summary['count'] += 1
+        summary['purchases'].append(enriched['purchase'])
+        summary['native_amount'] += enriched['native_amount']
+        summary['usd_value'] += enriched['usd_value']
+        summary['token_amount'] += enriched['purchase'].get('token_amount', 0)
+        summary['market_cap_usd'] = enriched['market_cap_usd']
+        if enriched['usd_value'] > summary['largest']['usd_value']:
+            summary['largest'] = enriched
+
+    def _take_gif(self, state, config, now):
+        if not config.get('custom_gif_url'):
+            return False
+        if state['gif_at'] is not None and now - state['gif_at'] < self.window:
+            return False
+        state['gif_at'] = now
+        self.stats['gifs'] += 1
+        return True
+
+    def flush(self, force=False):
+        """Send summaries for closed windows (all pending ones if `force`) and drop idle keys."""
+        now = time.monotonic()
+        backlogged = not force and telegram_dispatcher.pending() > self.backlog_limit
+        due = []
+        with self._lock:
+            for key, state in list(self._windows.items()):
+                if not force and now - state['opened'] < self.window:
+                    continue
+                if state['summary'] is None:
+                    del self._windows[key]
+                    continue
+                if backlogged:
+                    self.stats['deferred'] += 1
+                    continue
+                gif = self._take_gif(state, state['config'], now)
+                due.append((key[0], state['config'], state['summary'], gif))
+                state['summary'] = None
+                state['opened'] = now
+                self.stats['summaries'] += 1
+
+        for chat_id, config, summary, gif in due:
+            if summary['count'] == 1:
+                future = send_purchase_alert(chat_id, config, summary['largest'], gif=gif)
+            else:
+                ALERTS_SENT.inc(summary['largest']['purchase'].get('chain', 'ETH'), 'summary')
+                future = send_alert_message(chat_id, config, render_purchase_summary(summary, config), gif)
+            alert_journal.track(future, chat_id, summary['purchases'])
+        return len(due)
+
+alert_coalescer = AlertCoalescer()
+
+def estimate_purchase_usd(chain, purchase):
+    """
+    USD value of a purchase before enrichment, computed the way
+    enrich_purchase does it: the native amount at the feed price, or, for
+    log-detected buys, the token amount at the cached token price.
+    """
+    native_amount = purchase.get('native_amount')
+    if native_amount is not None:
+        return native_amount * native_price_feed.get_price(chain)
+    token_info = get_cached_token_info(purchase['token_address'], chain)
+    return purchase.get('token_amount', 0) * token_info.get('price_usd', 0)
+
+def min_buy_recipients(chain, purchase, chat_ids):
+    """
+    The chats among `chat_ids` whose /setminbuy minimum `purchase` clears.
+    The purchase is compared once with the lowest minimum of the token's
+    subscribers, so dust is dropped before any balance lookup or send; only
+    a purchase that clears it is split across the sorted thresholds.
+    """
+    entries = config_store.min_buys.get((chain, purchase['token_address']))
+    if not entries:
+        return list(chat_ids)
+    # A subscriber without a minimum takes every buy
+    lowest = entries[0][0] if len(entries) >= len(chat_ids) else 0
+    try:
+        usd_value = estimate_purchase_usd(chain, purchase)
+    except Exception as e:
+        # An unknown value is alerted to everyone rather than silently dropped
+        logger.warning(f"Could not value purchase {purchase.get('txn_hash')} on {chain}: {e}")
+        return list(chat_ids)
+    if usd_value < lowest:
+        BELOW_MIN_BUY.inc(chain)
+        return []
+    too_small = {chat_id for _, chat_id in entries[bisect.bisect_right(entries, (usd_value, math.inf)):]}
+    return [chat_id for chat_id in chat_ids if chat_id not in too_small]
+
+def dispatch_purchases(chain, purchases, subscriptions, cursors=None):
+    """
+    Alert every chat subscribed to each purchase's token whose minimum buy it
+    clears. Purchases are journaled as pending first, and only then are the
+    detectors' new `cursors` saved, so a crash or a failed enrichment never
+    leaves a purchase behind a cursor without a journal entry to replay.
+    Purchases are enriched once each, concurrently so their RPC lookups
+    share batches, then rendered cheaply per chat.
+    """
+    claimed = []
+    for purchase in purchases:
+        logger.info(f"Purchase detected: {purchase}")
+        chat_ids = subscriptions.get((chain, purchase['token_address']))
+        if chat_ids:
+            chat_ids = min_buy_recipients(chain, purchase, chat_ids)
+        if chat_ids:
+            # Chats that already got this purchase (e.g. before a restart) are skipped
+            chat_ids = alert_journal.claim(purchase, chat_ids)
+        if chat_ids:
+            claimed.append((purchase, chat_ids))
+    if cursors:
+        config_store.set_cursors(cursors)
+
+    # Submitted one by one so a failed lookup only holds back its own purchase
+    enrichments = [enrichment_executor.submit(timed_enrich_purchase, purchase) for purchase, _ in claimed]
+    for (purchase, chat_ids), enrichment in zip(claimed, enrichments):
+        try:
+            enriched = enrichment.result()
+        except Exception as e:
+            logger.error(f"Error enriching purchase {purchase.get('txn_hash')} on {chain}, retrying next cycle: {e}")
+            alert_journal.defer(purchase, chat_ids)
+            continue
+        # Timed per purchase rather than per chat: a per-render timer would cost as much as the render
+        with STAGE_SECONDS.time('fanout', chain):
+            for chat_id in chat_ids:
+                config = bot_configs.get(chat_id)
+                if config is not None:
+                    alert_coalescer.submit(chat_id, config, enriched)
+
+# --- Poll Planning ---
+def build_subscription_index(configs):
+    """
+    Invert chat configs into a (chain, contract) -> set(chat_id) index.
+    Each watched contract appears once no matter how many chats watch it.
+    """
+    subscriptions = {}
+    # Snapshot the items so webhook writes can't change the dict mid-iteration
+    for chat_id, config in list(configs.items()):
+        for chain, contracts in list(config.get('watched_tokens', {}).items()):
+            for contract_address in list(contracts):
+                subscriptions.setdefault((chain, contract_address), set()).add(chat_id)
+    return subscriptions
+
+def filter_owned(subscriptions, owns=None):
+    """Keep only the (chain, contract) keys for which `owns(chain, contract)` is true."""
+    if owns is None:
+        return subscriptions
+    return {key: chats for key, chats in subscriptions.items() if owns(*key)}
+
+def plan_chain_polls(subscriptions):
+    """Group the distinct subscribed contracts by chain for one poll per chain."""
+    plan = {}
+    for chain, contract_address in subscriptions:
+        plan.setdefault(chain, []).append(contract_address)
+    return plan
+
+# --- Adaptive Poll Scheduler ---
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "true").lower() in ("1", "true", "yes")
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "5"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "600"))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "2"))
+POLL_RATE_ALPHA = float(os.getenv("POLL_RATE_ALPHA", "0.3"))
+
+class AdaptivePollScheduler:
+    """
+    Chooses which watched (chain, contract) pairs to poll each cycle, for
+    chains where every polled contract costs its own requests (see
+    polls_per_contract). Each pair has a next-due time in a per-chain heap.
+    A poll that finds buys resets the pair to `min_interval`; an empty poll
+    multiplies its interval by `backoff`, up to `max_interval`, so dormant
+    tokens fade out of the RPC bill. Per chain, contracts are taken most
+    overdue first until their RPC requests (as measured on each one's last
+    poll) reach the chain's 'poll_budget'. Unused budget goes to the
+    not-yet-due contracts with the highest EWMA buy rate. wake() makes a
+    pair due at once; it is called when a chat adds the token, when a new
+    pool for it is indexed (from the EVM poll or stream) and on each Solana
+    stream notification for its mint or pools.
+    """
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL,
+                 backoff=POLL_BACKOFF, alpha=POLL_RATE_ALPHA, budgets=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.alpha = alpha
+        self.budgets = budgets or {chain: config.get('poll_budget') for chain, config in SUPPORTED_CHAINS.items()}
+        self._state = {}  # (chain, contract) -> {'due', 'interval', 'rate', 'last_poll', 'cost'}
+        self._heaps = {}  # chain -> [(due, contract)], stale entries skipped on pop
+        self._lock = threading.Lock()
+        self.stats = {'planned': 0, 'early': 0, 'woken': 0}
+
+    def _push(self, chain, contract_address, due):
+        heapq.heappush(self._heaps.setdefault(chain, []), (due, contract_address))
+
+    def _track(self, chain, contract_address, now):
+        state = self._state[(chain, contract_address)] = {
+            'due': now, 'interval': self.min_interval, 'rate': 0.0, 'last_poll': None, 'cost': 1
+        }
+        self._push(chain, contract_address, now)
+        return state
+
+    def sync(self, subscriptions, now=None):
+        """Start tracking new subscription keys (due at once) and forget removed ones."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for key in subscriptions:
+                if key not in self._state:
+                    self._track(*key, now)
+            for key in [key for key in self._state if key not in subscriptions]:
+                del self._state[key]
+
+    def wake(self, chain, contract_address, now=None):
+        """Make a pair due immediately (e.g. it was just added, or its pool traded)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state.get((chain, contract_address))
+            if state is None:
+                self._track(chain, contract_address, now)
+            elif state['due'] > now:
+                state['due'] = now
+                self._push(chain, contract_address, now)
+            self.stats['woken'] += 1
+
+    def plan(self, subscriptions, now=None):
+        """Chain -> contracts to poll this cycle, within each chain's request budget."""
+        now = time.monotonic() if now is None else now
+        self.sync(subscriptions, now)
+        plan = {}
+        with self._lock:
+            for chain, heap in self._heaps.items():
+                budget = self.budgets.get(chain) or float('inf')
+                chosen = []
+                spent = 0
+                while heap and spent < budget and heap[0][0] <= now:
+                    due, contract_address = heapq.heappop(heap)
+                    state = self._state.get((chain, contract_address))
+                    if state is None or state['due'] != due or contract_address in chosen:
+                        continue  # Stale entry: removed, rescheduled or woken
+                    chosen.append(contract_address)
+                    spent += state['cost']
+
+                if spent < budget:
+                    # Spend leftover budget on the hottest tokens that aren't due yet
+                    selected = set(chosen)
+                    candidates = sorted((
+                        (state['rate'], contract_address)
+                        for (state_chain, contract_address), state in self._state.items()
+                        if state_chain == chain and state['rate'] > 0 and contract_address not in selected
+                    ), reverse=True)
+                    early = []
+                    for _, contract_address in candidates:
+                        if spent >= budget:
+                            break
+                        early.append(contract_address)
+                        spent += self._state[(chain, contract_address)]['cost']
+                    chosen.extend(early)
+                    self.stats['early'] += len(early)
+
+                for contract_address in chosen:
+                    # Provisional reschedule so a failed poll that never reaches record() retries
+                    state = self._state[(chain, contract_address)]
+                    state['due'] = now + state['interval']
+                    self._push(chain, contract_address, state['due'])
+                if chosen:
+                    plan[chain] = chosen
+                    self.stats['planned'] += len(chosen)
+        return plan
+
+    def record(self, chain, contract_addresses, purchases, now=None, costs=None):
+        """
+        Update buy rates, request costs and next-due times after polling
+        `contract_addresses`; `costs` maps contracts to the requests they took.
+        """
+        now = time.monotonic() if now is None else now
+        buys = {}
+        for purchase in purchases:
+            buys[purchase['token_address']] = buys.get(purchase['token_address'], 0) + 1
+        with self._lock:
+            for contract_address in contract_addresses:
+                state = self._state.get((chain, contract_address))
+                if state is None:
+                    continue
+                count = buys.get(contract_address, 0)
+                if state['last_poll'] is not None:
+                    elapsed = max(now - state['last_poll'], self.min_interval, 1e-3)
+                    state['rate'] += self.alpha * (count / elapsed - state['rate'])
+                state['last_poll'] = now
+                state['cost'] = max((costs or {}).get(contract_address, 1), 1)
+                if count:
+                    state['interval'] = self.min_interval
+                else:
+                    state['interval'] = min(state['interval'] * self.backoff, self.max_interval)
+                state['due'] = now + state['interval']
+                self._push(chain, contract_address, state['due'])
+
+    def _watchlist_changed(self, chain, token_key):
+        if polls_per_contract(chain) and (chain, token_key) in config_store.subscriptions:
+            self.wake(chain, token_key)
+
+poll_scheduler = AdaptivePollScheduler()
+config_store.add_listener(poll_scheduler._watchlist_changed)
+
+def plan_monitor_cycle(subscriptions):
+    """
+    Contracts to poll this cycle. Chains polled per contract get the adaptive
+    scheduler's pick; chains read with one merged request poll every
+    contract every cycle, since backing off would only delay their alerts.
+    """
+    if not ADAPTIVE_POLLING:
+        return plan_chain_polls(subscriptions)
+    budgeted = {key: chats for key, chats in subscriptions.items() if polls_per_contract(key[0])}
+    plan = plan_chain_polls({key: chats for key, chats in subscriptions.items() if key not in budgeted})
+    plan.update(poll_scheduler.plan(budgeted))
+    return plan
+
 # --- Blockchain Monitoring Loop ---
-def monitor_all_chains_for_purchases():
+def monitor_all_chains_for_purchases(owns=None):
     """
     Function that would be triggered periodically to monitor all chains
     and tokens configured in all chats.
+    Each distinct contract is fetched once per cycle and its purchases are
+    fanned out to every subscribed chat. `owns(chain, contract)` restricts
+    the cycle to a worker's shard.
     """
     logger.info("Starting blockchain monitoring...")
-    
-    for chat_id, config in bot_configs.items():
-        watched_tokens = config.get('watched_tokens', {})
-        for chain, contracts in watched_tokens.items():
-            if contracts:
-                logger.info(f"Monitoring {chain} for contracts: {contracts} for chat {chat_id}")
-                purchases = get_latest_token_purchases(chain, contracts)
-                
-                for purchase in purchases:
-                    logger.info(f"Purchase detected: {purchase}")
-                    
-                    # Send custom GIF if configured
-                    if config.get('custom_gif_url'):
-                        send_telegram_animation(chat_id, config['custom_gif_url'])
-                    
-                    # Send formatted message
-                    message = format_purchase_message(purchase, config)
-                    send_telegram_message(chat_id, message)
-                    
-                    # Small delay to avoid flooding Telegram API
-                    time.sleep(1)
-    
+    native_price_feed.start()
+    alert_journal.replay_pending(owns)
+    alert_journal.maybe_compact()
+
+    subscriptions = filter_owned(build_subscription_index(bot_configs), owns)
+    for chain, contracts in plan_monitor_cycle(subscriptions).items():
+        logger.info(f"Monitoring {chain} for {len(contracts)} contracts")
+        # One chain's RPC outage must not stop the others from being polled
+        try:
+            costs, cursors = {}, {}
+            purchases = get_latest_token_purchases(chain, contracts, costs, cursors)
+            poll_scheduler.record(chain, contracts, purchases, costs=costs)
+            dispatch_purchases(chain, purchases, subscriptions, cursors)
+        except Exception as e:
+            logger.error(f"Error monitoring {chain}: {e}")
+
     logger.info("Blockchain monitoring completed.")
 
+# --- Async Monitoring Engine ---
+async def _claim_purchase_async(loop, executor, chain_limiter, chain, purchase, subscriptions):
+    """Value one purchase and journal it as pending for its chats; returns the claimed chat_ids."""
+    logger.info(f"Purchase detected: {purchase}")
+    subscribers = subscriptions.get((chain, purchase['token_address']))
+    if not subscribers:
+        return []
+    async with chain_limiter:
+        chat_ids = await loop.run_in_executor(executor, min_buy_recipients, chain, purchase, subscribers)
+        if not chat_ids:
+            return []
+        return await loop.run_in_executor(executor, alert_journal.claim, purchase, chat_ids)
+
+async def _process_purchase_async(loop, executor, chain_limiter, chain, purchase, chat_ids):
+    """
+    Enrich one claimed purchase under its chain's in-flight limit, then queue
+    its alerts. Sends are not awaited: the dispatcher paces them per chat and
+    the alert journal records their delivery, so a rate-limited group never
+    holds up the cycle or other chats.
+    """
+    async with chain_limiter:
+        try:
+            enriched = await loop.run_in_executor(executor, timed_enrich_purchase, purchase)
+        except Exception as e:
+            logger.error(f"Error enriching purchase {purchase.get('txn_hash')} on {chain}, retrying next cycle: {e}")
+            alert_journal.defer(purchase, chat_ids)
+            return
+
+    for chat_id in chat_ids:
+        config = bot_configs.get(chat_id)
+        if config is not None:
+            alert_coalescer.submit(chat_id, config, enriched)
+
+async def _poll_chain_async(loop, executor, chain_limiter, chain, contracts, subscriptions):
+    """
+    Poll a chain's planned contracts in one detection call (one merged
+    eth_getLogs on EVM chains), journal its purchases, save the new cursors
+    once every purchase is journaled, then enrich and alert concurrently.
+    """
+    try:
+        costs, cursors = {}, {}
+        purchases = await loop.run_in_executor(executor, get_latest_token_purchases, chain, contracts, costs, cursors)
+    except Exception as e:
+        logger.error(f"Error polling {chain}: {e}")
+        return
+    poll_scheduler.record(chain, contracts, purchases, costs=costs)
+
+    claims = await asyncio.gather(*(
+        _claim_purchase_async(loop, executor, chain_limiter, chain, purchase, subscriptions)
+        for purchase in purchases
+    ), return_exceptions=True)
+    claimed = []
+    for purchase, result in zip(purchases, claims):
+        if isinstance(result, Exception):
+            logger.error(f"Error claiming purchase {purchase.get('txn_hash')} on {chain}: {result}")
+            cursors = None  # Re-read next cycle; the journal dedupes what was claimed
+        elif result:
+            claimed.append((purchase, result))
+    if cursors:
+        await loop.run_in_executor(executor, config_store.set_cursors, cursors)
+
+    await asyncio.gather(*(
+        _process_purchase_async(loop, executor, chain_limiter, chain, purchase, chat_ids)
+        for purchase, chat_ids in claimed
+    ))
+
+async def monitor_all_chains_for_purchases_async(owns=None):
+    """
+    Asyncio variant of monitor_all_chains_for_purchases.
+    All chains are polled at the same time, each with one detection call
+    over its planned contracts; the per-purchase lookups that follow are
+    limited to the chain's SUPPORTED_CHAINS 'max_in_flight', and alerts are
+    queued without waiting for Telegram, so a cycle takes as long as the
+    slowest chain.
+    """
+    logger.info("Starting async blockchain monitoring...")
+    native_price_feed.start()
+    alert_journal.replay_pending(owns)
+    alert_journal.maybe_compact()
+
+    subscriptions = filter_owned(build_subscription_index(bot_configs), owns)
+    plan = plan_monitor_cycle(subscriptions)
+
+    # Blocking calls run in a pool sized for every permit that can be held at once
+    max_workers = sum(SUPPORTED_CHAINS.get(chain, {}).get('max_in_flight', 4) + 1 for chain in plan)
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        await asyncio.gather(*(
+            _poll_chain_async(
+                loop, executor, asyncio.Semaphore(SUPPORTED_CHAINS.get(chain, {}).get('max_in_flight', 4)),
+                chain, contracts, subscriptions
+            )
+            for chain, contracts in plan.items()
+        ))
+
+    logger.info("Async blockchain monitoring completed.")
+
+# --- Streaming Ingest ---
+STREAM_RECONNECT_DELAY = float(os.getenv("STREAM_RECONNECT_DELAY", "1"))
+STREAM_MAX_RECONNECT_DELAY = float(os.getenv("STREAM_MAX_RECONNECT_DELAY", "30"))
+
+class ChainStream:
+    """
+    One persistent websocket subscription for a chain.
+    EVM chains subscribe to Transfer logs of every watched contract with a
+    single eth_subscribe; Solana gets one logsSubscribe per mint and per
+    Raydium AMM v4 pool, and each notification's transaction is fetched and
+    decoded on its own. The filter is re-synced live when the watched set
+    changes. On every (re)connect the subscription goes live first and its
+    notifications are buffered while the detector backfills from the
+    persisted cursors, so no block falls between the two; the alert journal
+    dedupes what both deliver.
+    """
+
+    def __init__(self, chain, url):
+        self.chain = chain
+        self.url = url
+        self.loop = None
+        self._filters_changed = None
+        self._requests = {}
+        self._next_id = 0
+        self._evm_subscription = None
+        self._evm_filter = []
+        self._solana_subscriptions = {}  # subscription id -> mint, one per mint and per pool
+        self._last_block = None
+        self._buffered = None  # notifications held back while backfilling
+
+    def filters_changed(self):
+        """Thread-safe signal that the chain's watched contracts changed."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._filters_changed.set)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._filters_changed = asyncio.Event()
+        delay = STREAM_RECONNECT_DELAY
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, max_size=None) as ws:
+                    logger.info(f"{self.chain} stream connected")
+                    delay = STREAM_RECONNECT_DELAY
+                    await self._session(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.chain} stream disconnected: {e}, reconnecting in {delay}s")
+            self._reset()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STREAM_MAX_RECONNECT_DELAY)
+
+    def _reset(self):
+        for future in self._requests.values():
+            if not future.done():
+                future.set_exception(ConnectionError("stream closed"))
+        self._requests = {}
+        self._evm_subscription = None
+        self._evm_filter = []
+        self._solana_subscriptions = {}
+        self._buffered = None
+
+    async def _session(self, ws):
+        reader = asyncio.create_task(self._read_loop(ws))
+        try:
+            self._buffered = []
+            self._filters_changed.clear()
+            await self._sync_subscriptions(ws)
+            await self._backfill()
+            buffered, self._buffered = self._buffered, None
+            for params in buffered:
+                self.loop.run_in_executor(None, self._handle_notification, params)
+            while not reader.done():
+                self._filters_changed.clear()
+                await self._sync_subscriptions(ws)
+                changed = asyncio.create_task(self._filters_changed.wait())
+                await asyncio.wait({reader, changed}, return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+            reader.result()
+        finally:
+            reader.cancel()
+
+    async def _request(self, ws, method, params):
+        self._next_id += 1
+        future = self.loop.create_future()
+        self._requests[self._next_id] = future
+        await ws.send(json.dumps({"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}))
+        return await asyncio.wait_for(future, timeout=30)
+
+    async def _sync_subscriptions(self, ws):
+        watched = sorted(config_store.watched_contracts(self.chain))
+        if self.chain == 'SOLANA':
+            current = set(self._solana_subscriptions.values())
+            for sub, mint in list(self._solana_subscriptions.items()):
+                if mint not in watched:
+                    await self._request(ws, 'logsUnsubscribe', [sub])
+                    del self._solana_subscriptions[sub]
+            added = sorted(set(watched) - current)
+            # Raydium AMM v4 swaps mention the pool, not the mint
+            pools = await self.loop.run_in_executor(None, solana_signature_detector.pool_addresses, added)
+            for mint in added:
+                for address in [mint, *pools[mint]]:
+                    sub = await self._request(ws, 'logsSubscribe', [{'mentions': [address]}, {'commitment': 'confirmed'}])
+                    self._solana_subscriptions[sub] = mint
+            return
+
+        if watched == self._evm_filter:
+            return
+        if self._evm_subscription is not None:
+            await self._request(ws, 'eth_unsubscribe', [self._evm_subscription])
+            self._evm_subscription = None
+        self._evm_filter = watched
+        if watched:
+            await self.loop.run_in_executor(None, pool_index.ensure, self.chain, watched)
+            self._evm_subscription = await self._request(ws, 'eth_subscribe', ['logs', {
+                'address': watched + pool_index.factory_addresses(self.chain),
+                'topics': [[TRANSFER_TOPIC, *POOL_CREATED_TOPICS]]
+            }])
+        logger.info(f"{self.chain} stream watching {len(watched)} contracts")
+
+    async def _backfill(self):
+        """Catch up on everything since the persisted cursors before streaming."""
+        contracts = config_store.watched_contracts(self.chain)
+        if contracts:
+            cursors = {}
+            purchases = await self.loop.run_in_executor(
+                None, get_latest_token_purchases, self.chain, contracts, None, cursors)
+            await self.loop.run_in_executor(
+                None, dispatch_purchases, self.chain, purchases, config_store.subscriptions, cursors)
+
+    async def _read_loop(self, ws):
+        async for raw in ws:
+            message = json.loads(raw)
+            future = self._requests.pop(message.get('id'), None)
+            if future is not None:
+                if message.get('error'):
+                    future.set_exception(RuntimeError(f"{self.chain} stream: {message['error']}"))
+                else:
+                    future.set_result(message.get('result'))
+            elif message.get('method') in ('eth_subscription', 'logsNotification'):
+                if self._buffered is not None:
+                    self._buffered.append(message['params'])
+                else:
+                    self.loop.run_in_executor(None, self._handle_notification, message['params'])
+
+    def _handle_notification(self, params):
+        try:
+            if self.chain == 'SOLANA':
+                mint = self._solana_subscriptions.get(params.get('subscription'))
+                value = params['result']['value']
+                if mint is None or value.get('err'):
+                    return
+                # The mint or one of its pools traded: poll it next cycle if the stream drops
+                poll_scheduler.wake(self.chain, mint)
+                # Only the notified transaction; cursors are left to the backfill on reconnect
+                purchase = solana_signature_detector.fetch(mint, value['signature'])
+                purchases = [purchase] if purchase else []
+            else:
+                log = params['result']
+                if log.get('removed'):
+                    return
+                self._advance_cursors(int(log.get('blockNumber', '0x0'), 16))
+                if (log.get('topics') or [None])[0] in POOL_CREATED_TOPICS:
+                    for token in pool_index.observe(self.chain, log):
+                        poll_scheduler.wake(self.chain, token)
+                    return
+                purchase = evm_log_detector.decode_transfer(self.chain, log)
+                purchases = [purchase] if purchase else []
+            dispatch_purchases(self.chain, purchases, config_store.subscriptions)
+        except Exception as e:
+            logger.error(f"Error handling {self.chain} stream notification: {e}")
+
+    def _advance_cursors(self, block_number):
+        """Persist the cursors once per new block so a reconnect backfills from here."""
+        if self._last_block is not None and block_number <= self._last_block:
+            return
+        self._last_block = block_number
+        # Never move a cursor back behind what the backfill already covered
+        cursors = {}
+        for contract in self._evm_filter:
+            key = evm_log_detector.cursor_key(self.chain, contract)
+            cursor = config_store.get_cursor(key)
+            if cursor is None or int(cursor) < block_number - 1:
+                cursors[key] = block_number - 1
+        config_store.set_cursors(cursors)
+
+class StreamingIngest:
+    """
+    Runs a ChainStream per chain with a ws_url and keeps their filters in
+    sync. Only runs on real chain data (DATA_SOURCE=rpc).
+    """
+
+    def __init__(self, chains=None):
+        self.streams = {
+            chain: ChainStream(chain, SUPPORTED_CHAINS[chain]['ws_url'])
+            for chain in (chains or SUPPORTED_CHAINS)
+            if SUPPORTED_CHAINS[chain].get('ws_url')
+        }
+        config_store.add_listener(self._watchlist_changed)
+
+    def _watchlist_changed(self, chain, token_key):
+        stream = self.streams.get(chain)
+        if stream is not None:
+            stream.filters_changed()
+
+    async def run(self):
+        if websockets is None:
+            raise RuntimeError("Streaming ingest requires the websockets package")
+        # Notifications come from real chains; mock detection would alert simulated buys for them
+        if DATA_SOURCE != 'rpc':
+            raise RuntimeError(f"Streaming ingest requires DATA_SOURCE=rpc (got {DATA_SOURCE})")
+        logger.info(f"Streaming ingest ({DATA_SOURCE} data) for {', '.join(self.streams) or 'no chains'}")
+        native_price_feed.start()
+        alert_journal.replay_pending()
+        await asyncio.gather(*(stream.run() for stream in self.streams.values()))
+
+# --- Sharded Workers ---
+WORKER_LEASE_PATH = os.getenv("WORKER_LEASE_PATH", os.path.join(DATA_DIR, "buyxanbot_workers.db"))
+WORKER_LEASE_TTL = float(os.getenv("WORKER_LEASE_TTL", "15"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "10"))
+HASH_RING_REPLICAS = int(os.getenv("HASH_RING_REPLICAS", "100"))
+
+class ConsistentHashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+    Adding or removing a node only moves the keys adjacent to its points,
+    about 1/N of the keyspace.
+    """
+
+    def __init__(self, nodes=(), replicas=HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self._points = []  # sorted hashes
+        self._owners = {}  # hash -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        # Stable across processes, unlike hash()
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if self._owners.pop(point, None) is not None:
+                self._points.remove(point)
+
+    def owner(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+class WorkerLeaseTable:
+    """
+    SQLite lease table shared by the workers on one host or volume.
+    A worker is live while its lease is unexpired, so crashed workers drop
+    out of the ring after WORKER_LEASE_TTL without any coordinator process.
+    """
+
+    def __init__(self, path=WORKER_LEASE_PATH, ttl=WORKER_LEASE_TTL):
+        self.ttl = ttl
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        if path != ':memory:':
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS worker_leases (worker_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+
+    def heartbeat(self, worker_id):
+        self.db.execute(
+            "INSERT INTO worker_leases (worker_id, expires_at) VALUES (?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET expires_at = excluded.expires_at",
+            (worker_id, time.time() + self.ttl)
+        )
+
+    def release(self, worker_id):
+        self.db.execute("DELETE FROM worker_leases WHERE worker_id = ?", (worker_id,))
+
+    def live_workers(self):
+        rows = self.db.execute(
+            "SELECT worker_id FROM worker_leases WHERE expires_at > ? ORDER BY worker_id", (time.time(),)
+        )
+        return [worker_id for (worker_id,) in rows]
+
+class MonitorWorker:
+    """
+    Monitor process that polls and alerts only for the (chain, contract)
+    keys it owns on the consistent-hash ring of live workers.
+    Configs come from the shared store (DATABASE_URL) and only the worker's
+    own tokens are loaded; they are reloaded when the store's config version
+    or the ring membership changes, not every cycle.
+    """
+
+    def __init__(self, worker_id, leases=None, interval=WORKER_POLL_INTERVAL):
+        if not config_store.shared:
+            raise RuntimeError("Workers need a config store shared with the webhook process: set DATABASE_URL")
+        self.worker_id = worker_id
+        self.leases = leases or WorkerLeaseTable()
+        self.interval = interval
+        self.ring = ConsistentHashRing()
+        self.members = []
+        self._loaded = None  # (config version, ring members) of the last load
+
+    def owns(self, chain, contract_address):
+        return self.ring.owner(f"{chain}:{contract_address}") == self.worker_id
+
+    def refresh_ring(self):
+        self.leases.heartbeat(self.worker_id)
+        members = self.leases.live_workers()
+        if members != self.members:
+            logger.info(f"Worker {self.worker_id}: ring members changed to {members}")
+            self.ring = ConsistentHashRing(members)
+            self.members = members
+
+    def refresh_configs(self):
+        """Reload this worker's tokens (and their cursors) if another process changed them or the ring moved."""
+        # Read before loading, so a write made during the load triggers another one
+        loaded = (config_store.version(), self.members)
+        if loaded[0] is None or loaded != self._loaded:
+            config_store.load(owns=self.owns)
+            self._loaded = loaded
+
+    def run_cycle(self):
+        self.refresh_ring()
+        self.refresh_configs()
+        monitor_all_chains_for_purchases(owns=self.owns)
+
+    def run(self):
+        logger.info(f"Worker {self.worker_id} starting")
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    self.run_cycle()
+                except Exception as e:
+                    logger.error(f"Worker {self.worker_id} cycle failed: {e}")
+                time.sleep(max(self.interval - (time.monotonic() - started), 0))
+        finally:
+            self.leases.release(self.worker_id)
+
 # --- Main Entry Point (for testing) ---
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        # The benchmarks live in bench/; same as: python -m bench [names...] [--out results.json]
+        # bench imports this module as `app`: hand it this instance rather than a second copy
+        sys.modules.setdefault('app', sys.modules[__name__])
+        from bench.__main__ import main
+        sys.exit(main(sys.argv[2:]))
+
+    if len(sys.argv) > 2 and sys.argv[1] == "worker":
+        MonitorWorker(sys.argv[2]).run()
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "stream":
+        asyncio.run(StreamingIngest().run())
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        import uvicorn  # Only needed to serve the ASGI app standalone
+        uvicorn.run(asgi_app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "monitor-async":
+        asyncio.run(monitor_all_chains_for_purchases_async())
+        alert_coalescer.flush(force=True)
+        telegram_dispatcher.join(timeout=60)
+        sys.exit(0)
+
     print("🤖 BuyXanBot Python Implementation")
     print("=" * 50)
     
@@ -580,21 +4236,21 @@ if __name__ == "__main__":
         }
     })
     
-    print("\n--- Simulation: /addtoken ETH 0xDummyEthToken ---")
+    print("\n--- Simulation: /addtoken ETH 0x1f9840a85d5aF5bf1D1762F925BDADdC4201F984 ---")
     handle_telegram_webhook({
         "update_id": 2,
         "message": {
             "chat": {"id": 12345, "type": "private"},
-            "text": "/addtoken ETH 0xDummyEthToken"
+            "text": "/addtoken ETH 0x1f9840a85d5aF5bf1D1762F925BDADdC4201F984"
         }
     })
     
-    print("\n--- Simulation: /addtoken SOLANA SolanaDummyToken ---")
+    print("\n--- Simulation: /addtoken SOLANA DezXAZ8z7PnrnRJjz3wXBoRgixCa6xjnB7YaB1pPB263 ---")
     handle_telegram_webhook({
         "update_id": 3,
         "message": {
             "chat": {"id": 12345, "type": "private"},
-            "text": "/addtoken SOLANA SolanaDummyToken"
+            "text": "/addtoken SOLANA DezXAZ8z7PnrnRJjz3wXBoRgixCa6xjnB7YaB1pPB263"
         }
     })
     
@@ -627,6 +4283,8 @@ if __name__ == "__main__":
     
     print("\n--- Simulation: Blockchain Monitoring ---")
     monitor_all_chains_for_purchases()
+    alert_coalescer.flush(force=True)
+    telegram_dispatcher.join(timeout=60)
     
     print("\n✅ Conceptual demonstration completed.")
     print("\nNote: This is a Python reference implementation.")
@@ -0,0 +1,41 @@
+# bench - Benchmarks and the offline load simulation for app.py
+# Run from the repository root: python -m bench [names...] [--out results.json]
+import json
+import sys
+from datetime import datetime
+
+from .benchmarks import (benchmark_adaptive_scheduler, benchmark_format_purchase_message, benchmark_hash_ring,
+                         benchmark_poll_planner, benchmark_webhook_dispatch)
+from .load_simulation import run_load_simulation
+
+BENCHMARKS = {
+    'poll_planner': benchmark_poll_planner,
+    'adaptive_scheduler': benchmark_adaptive_scheduler,
+    'hash_ring': benchmark_hash_ring,
+    'format_purchase_message': benchmark_format_purchase_message,
+    'webhook_dispatch': benchmark_webhook_dispatch,
+    'load_simulation': run_load_simulation
+}
+
+def run_benchmarks(names=None, output=None):
+    """
+    Run the named benchmarks (all by default) and print their results as JSON.
+    With `output`, the results are also written there, stamped with the run
+    time and Python version, for run-to-run comparison.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            continue
+        results[name] = BENCHMARKS[name]()
+        print(json.dumps({name: results[name]}, indent=2))
+    if output:
+        with open(output, 'w') as f:
+            json.dump({
+                'generated_at': datetime.now().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0],
+                'results': results
+            }, f, indent=2)
+        print(f"Results written to {output}")
+    return results
@@ -0,0 +1,17 @@
+# python -m bench [names...] [--out results.json]
+import sys
+
+from . import run_benchmarks
+
+def main(args):
+    args = list(args)
+    output = None
+    if "--out" in args:
+        index = args.index("--out")
+        output = args[index + 1] if index + 1 < len(args) else "bench_results.json"
+        del args[index:index + 2]
+    run_benchmarks(args, output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,272 @@
+# bench/load_simulation.py - Offline end-to-end load test of the monitor against local upstream stubs
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+from .workloads import generate_synthetic_configs, peak_rss_mb, percentile
+
+class _LoadSimulationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real upstreams
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(self.server.stub.handle_post(self.path, json.loads(body or b'{}')))
+
+    def do_GET(self):
+        self._reply(self.server.stub.handle_get(self.path))
+
+    def _reply(self, payload):
+        out = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+class LoadSimulationStub:
+    """
+    Local stand-in for the Telegram Bot API, EVM JSON-RPC and the price feed,
+    so the load simulation runs offline.
+    Each block served by eth_getLogs holds `buys_per_block` Transfer logs per
+    requested contract, sent from the token's one v2 pair. Their emission times are recorded so the latency of
+    each alert is known when its tx link reaches sendMessage.
+    """
+
+    TX_LINK_RE = re.compile(r"/tx/(0x[0-9a-f]{64})")
+
+    def __init__(self, buys_per_block=1, telegram_latency=0.0):
+        self.buys_per_block = buys_per_block
+        self.telegram_latency = telegram_latency
+        self.head = 1000
+        self.emitted = {}  # txn_hash -> perf_counter() when its log was served
+        self.latencies = []
+        self.counts = {}
+        self._txn_seq = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _LoadSimulationHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="load-sim-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def advance(self, blocks):
+        with self._lock:
+            self.head += blocks
+
+    def snapshot_counts(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def handle_get(self, path):
+        self._count('price_feed')
+        return {config['price_id']: {'usd': config['native_price']} for config in app.SUPPORTED_CHAINS.values()}
+
+    def handle_post(self, path, body):
+        if path.startswith('/bot'):
+            return self._telegram(path.rsplit('/', 1)[-1], body)
+        self._count('rpc_http')
+        if isinstance(body, list):
+            return [self._rpc(request) for request in body]
+        return self._rpc(body)
+
+    def _telegram(self, method, payload):
+        if self.telegram_latency:
+            time.sleep(self.telegram_latency)
+        received = time.perf_counter()
+        self._count(f"telegram:{method}")
+        text = payload.get('text') or payload.get('caption') or ''
+        for txn_hash in set(self.TX_LINK_RE.findall(text)):
+            emitted = self.emitted.get(txn_hash)
+            if emitted is not None:
+                with self._lock:
+                    self.latencies.append(received - emitted)
+        return {"ok": True, "result": {"message_id": 1, "animation": {"file_id": "load-sim-gif"}}}
+
+    def _rpc(self, request):
+        method = request.get('method')
+        params = request.get('params') or []
+        self._count(f"rpc:{method}")
+        if method == 'eth_blockNumber':
+            result = hex(self.head)
+        elif method == 'eth_getLogs':
+            result = self._logs(params[0])
+        elif method == 'eth_call':
+            result = self._erc20(params[0]['data'][:10])
+        else:
+            result = None
+        return {"jsonrpc": "2.0", "id": request.get('id'), "result": result}
+
+    def _logs(self, log_filter):
+        addresses = log_filter['address']
+        addresses = [addresses] if isinstance(addresses, str) else addresses
+        # Factories emit no Transfers
+        addresses = [address for address in addresses if not any(address in factories for factories in app.DEX_FACTORIES.values())]
+        logs = []
+        now = time.perf_counter()
+        with self._lock:
+            for block in range(int(log_filter['fromBlock'], 16), int(log_filter['toBlock'], 16) + 1):
+                for address in addresses:
+                    for _ in range(self.buys_per_block):
+                        self._txn_seq += 1
+                        txn_hash = f"0x{self._txn_seq:064x}"
+                        self.emitted[txn_hash] = now
+                        logs.append({
+                            'address': address,
+                            'topics': [app.TRANSFER_TOPIC, '0x' + '0' * 24 + '11' * 20, f"0x{self._txn_seq:064x}"],
+                            'data': hex(5 * 10 ** 21),
+                            'blockNumber': hex(block),
+                            'transactionHash': txn_hash,
+                            'logIndex': '0x0'
+                        })
+        return logs
+
+    @staticmethod
+    def _erc20(selector):
+        def word(value):
+            return '0x' + value.to_bytes(32, 'big').hex()
+
+        def string(value):
+            data = value.encode()
+            return word(32) + len(data).to_bytes(32, 'big').hex() + data.ljust(32, b'\0').hex()
+
+        return {
+            app.SELECTOR_NAME: string('Load Test Token'),
+            app.SELECTOR_SYMBOL: string('LOAD'),
+            app.SELECTOR_DECIMALS: word(18),
+            app.SELECTOR_TOTAL_SUPPLY: word(10 ** 27),
+            app.SELECTOR_BALANCE_OF: word(10 ** 24),
+            app.SELECTOR_GET_PAIR: word(int('11' * 20, 16))
+        }.get(selector, '0x')
+
+# app module globals the simulation replaces while it runs
+SWAPPED_GLOBALS = ('TELEGRAM_API_URL', 'DATA_SOURCE', 'config_store', 'bot_configs', 'alert_journal', 'alert_coalescer',
+                   'lookup_cache', 'telegram_dispatcher', 'native_price_feed', 'poll_scheduler', 'pool_index')
+
+def run_load_simulation(num_chats=500, num_tokens=60, tokens_per_chat=3, buys_per_block=1,
+                        blocks_per_cycle=2, cycles=5, telegram_latency=0.0,
+                        real_rate_limits=False, coalesce_window=0, seed=42):
+    """
+    Offline end-to-end load test against LoadSimulationStub.
+    Chats subscribe through handle_telegram_webhook (/addtoken), then each
+    cycle advances the stub chain and runs monitor_all_chains_for_purchases
+    in rpc mode until every alert is sent. Reports webhook updates/sec,
+    alerts/sec, p50/p99 buy-to-send latency, upstream calls per cycle and
+    peak RSS. The app module's singletons are swapped for fresh in-memory
+    ones and restored afterwards, so no real store, journal or upstream is
+    touched.
+    """
+    chains = [chain for chain in app.SUPPORTED_CHAINS if chain != 'SOLANA']
+    stub = LoadSimulationStub(buys_per_block, telegram_latency).start()
+    saved_globals = {name: getattr(app, name) for name in SWAPPED_GLOBALS}
+    saved_rpc_urls = {chain: config['rpc_url'] for chain, config in app.SUPPORTED_CHAINS.items()}
+    saved_level = app.logger.level
+
+    app.TELEGRAM_API_URL = stub.url
+    app.DATA_SOURCE = 'rpc'
+    for chain in chains:
+        app.SUPPORTED_CHAINS[chain]['rpc_url'] = f"{stub.url}/rpc/{chain}"
+    app.config_store = app.ConfigStore()
+    app.bot_configs = app.config_store.configs
+    app.alert_journal = app.AlertJournal(':memory:')
+    app.alert_coalescer = app.AlertCoalescer(window=coalesce_window)
+    app.lookup_cache = app.TTLCache()
+    app.native_price_feed = app.NativePriceFeed(url=f"{stub.url}/price")
+    # Every block carries buys, so poll every contract every cycle
+    app.poll_scheduler = app.AdaptivePollScheduler(min_interval=0)
+    app.pool_index = app.PoolIndex(path='')
+    if real_rate_limits:
+        app.telegram_dispatcher = app.TelegramDispatcher()
+    else:
+        app.telegram_dispatcher = app.TelegramDispatcher(global_rate=1e9, chat_rate=1e9, group_rate=1e9)
+    app.logger.setLevel(logging.WARNING)
+
+    results = {
+        'workload': {
+            'chats': num_chats, 'tokens': num_tokens, 'tokens_per_chat': tokens_per_chat,
+            'buys_per_block': buys_per_block, 'blocks_per_cycle': blocks_per_cycle, 'cycles': cycles,
+            'telegram_latency_ms': telegram_latency * 1000, 'real_rate_limits': real_rate_limits,
+            'coalesce_window': coalesce_window, 'seed': seed
+        }
+    }
+    try:
+        # Subscriptions arrive the way users create them
+        configs = generate_synthetic_configs(num_chats, num_tokens, tokens_per_chat, seed, chains)
+        updates = [
+            json.dumps({"update_id": index, "message": {
+                "chat": {"id": chat_id}, "text": f"/addtoken {chain} {contract_address}"
+            }}).encode()
+            for index, (chat_id, chain, contract_address) in enumerate(
+                (chat_id, chain, contract_address)
+                for chat_id, config in configs.items()
+                for chain, contracts in config['watched_tokens'].items()
+                for contract_address in contracts
+            )
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            list(executor.map(app.handle_telegram_webhook, updates))
+        results['webhook_updates'] = len(updates)
+        results['webhook_updates_per_sec'] = round(len(updates) / (time.perf_counter() - started))
+
+        # Warm-up cycle: new contracts start at the head, metadata gets cached
+        app.monitor_all_chains_for_purchases()
+        app.telegram_dispatcher.join()
+        stub.latencies.clear()
+
+        before = stub.snapshot_counts()
+        elapsed = 0.0
+        for _ in range(cycles):
+            stub.advance(blocks_per_cycle)
+            started = time.perf_counter()
+            app.monitor_all_chains_for_purchases()
+            app.alert_coalescer.flush(force=True)
+            app.telegram_dispatcher.join()
+            elapsed += time.perf_counter() - started
+        after = stub.snapshot_counts()
+
+        per_cycle = {
+            name: round((after.get(name, 0) - before.get(name, 0)) / cycles, 1)
+            for name in sorted(after) if after.get(name, 0) != before.get(name, 0)
+        }
+        alerts = after.get('telegram:sendMessage', 0) - before.get('telegram:sendMessage', 0)
+        latencies = stub.latencies
+        results.update({
+            'alerts': alerts,
+            'alerts_per_sec': round(alerts / elapsed) if elapsed else None,
+            'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            'rpc_requests_per_cycle': per_cycle.get('rpc_http', 0),
+            'upstream_calls_per_cycle': per_cycle,
+            'cycle_ms': round(elapsed / cycles * 1000, 2),
+            'peak_rss_mb': peak_rss_mb()
+        })
+    finally:
+        app.native_price_feed.stop()
+        app.alert_coalescer.stop()
+        for name, value in saved_globals.items():
+            setattr(app, name, value)
+        for chain, rpc_url in saved_rpc_urls.items():
+            app.SUPPORTED_CHAINS[chain]['rpc_url'] = rpc_url
+        app.logger.setLevel(saved_level)
+        stub.stop()
+    return results
@@ -0,0 +1,88 @@
+# bench/reference.py - Pre-optimization versions of hot paths, kept as benchmark baselines
+# Each benchmark checks that the production function still agrees with its baseline.
+import json
+
+import app
+
+def format_purchase_message(purchase_data, config):
+    """Pre-template format_purchase_message (string +=), kept as the benchmark baseline."""
+    token_name = purchase_data.get('token_name', 'Unknown Token')
+    token_symbol = purchase_data.get('token_symbol', 'TOK')
+    chain = purchase_data.get('chain', 'ETH')
+    native_amount = purchase_data.get('native_amount', 0)
+    token_amount = purchase_data.get('token_amount', 0)
+    buyer_address = purchase_data.get('buyer_address', 'N/A')
+    txn_hash = purchase_data.get('txn_hash', 'N/A')
+    token_address = purchase_data.get('token_address', 'N/A')
+
+    token_info = app.get_cached_token_info(token_address, chain)
+    market_cap_usd = token_info.get('market_cap_usd', 0)
+    total_supply = token_info.get('total_supply', 0)
+
+    chain_config = app.SUPPORTED_CHAINS.get(chain, app.SUPPORTED_CHAINS['ETH'])
+    native_symbol = chain_config['symbol']
+    explorer_url = chain_config['explorer']
+    usd_value = native_amount * app.native_price_feed.get_price(chain)
+
+    custom_emoji = config.get('custom_emoji', '🟢')
+    emoji_count = min(max(int(usd_value / 100), 1), 20)
+    emojis = custom_emoji * emoji_count
+
+    wallet_balance = app.get_cached_wallet_balance(buyer_address, token_address, chain)
+    position_percent = (wallet_balance / total_supply) * 100 if total_supply > 0 else 0
+    short_buyer = f"{buyer_address[:6]}...{buyer_address[-4:]}" if len(buyer_address) > 10 else buyer_address
+    chart_link = app.build_chart_link(chain, token_address)
+    trade_link = app.build_trade_link(chain, token_address)
+
+    message = f"<b>{token_name}</b> ({token_symbol}) Buy!\n\n"
+    message += f"{emojis}\n\n"
+    message += f"💵 {native_amount:.3f} {native_symbol} (${usd_value:,.2f})\n"
+    message += f"🪙 {token_amount:,.0f} {token_symbol}\n"
+    message += f"🔷 <a href='{explorer_url}/address/{buyer_address}'>{short_buyer}</a> | "
+    message += f"Txn <a href='{explorer_url}/tx/{txn_hash}'>🔗</a>\n"
+    message += f"🔼 Position +{position_percent:.1f}%\n"
+    message += f"🔼 Market Cap ${market_cap_usd:,.0f}\n\n"
+    message += f"📊 <a href='{chart_link}'>Chart</a>\n"
+    message += f"🦄 <a href='{trade_link}'>Trade</a>\n"
+    message += "🔹 <a href='https://t.me/buyxanbot'>Join Community</a>"
+    return message
+
+def handle_telegram_webhook(request_body, route):
+    """Pre-dispatch-table handle_telegram_webhook (eager logging, if/elif routing), kept as the benchmark baseline."""
+    try:
+        if isinstance(request_body, (str, bytes)):
+            update = json.loads(request_body)
+        else:
+            update = request_body
+
+        app.logger.info(f"Telegram update received: {update}")
+
+        if "message" in update:
+            message = update["message"]
+            chat_id = message["chat"]["id"]
+            text = message.get("text", "")
+
+            if text.startswith("/"):
+                command_parts = text.split(" ", 1)
+                command = command_parts[0].lower()
+                args = command_parts[1].split(" ") if len(command_parts) > 1 else []
+
+                if command in ["/start", "/help"]:
+                    route('/start', chat_id, args)
+                elif command == "/addtoken":
+                    route(command, chat_id, args)
+                elif command == "/removetoken":
+                    route(command, chat_id, args)
+                elif command == "/listtokens":
+                    route(command, chat_id, args)
+                elif command == "/setgif":
+                    route(command, chat_id, args)
+                elif command == "/setemoji":
+                    route(command, chat_id, args)
+                else:
+                    route(None, chat_id, args)
+
+        return {"statusCode": 200, "body": "OK"}
+    except Exception as e:
+        app.logger.error(f"Error in handle_telegram_webhook: {e}")
+        return {"statusCode": 500, "body": f"Internal server error: {e}"}
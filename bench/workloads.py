@@ -0,0 +1,79 @@
+# bench/workloads.py - Synthetic inputs and measurement helpers shared by the benchmarks
+import json
+import random
+import sys
+
+try:
+    import resource  # Unix only, used for peak RSS in the load simulation
+except ImportError:
+    resource = None
+
+import app
+
+def generate_synthetic_configs(num_chats, num_tokens, tokens_per_chat=3, seed=42, chains=None):
+    """
+    Build synthetic bot_configs with heavy token overlap between chats.
+    Token popularity is skewed so a few tokens are watched by most chats.
+    """
+    rng = random.Random(seed)
+    chains = list(chains or app.SUPPORTED_CHAINS)
+    universe = [
+        (chains[i % len(chains)], f"0x{i:040x}")
+        for i in range(num_tokens)
+    ]
+    weights = [1.0 / (rank + 1) for rank in range(num_tokens)]
+
+    configs = {}
+    for chat_id in range(1, num_chats + 1):
+        watched_tokens = {chain: {} for chain in chains}
+        for chain, contract_address in rng.choices(universe, weights=weights, k=tokens_per_chat):
+            watched_tokens[chain][contract_address] = contract_address
+        configs[chat_id] = {
+            'watched_tokens': watched_tokens,
+            'custom_gif_url': None,
+            'custom_emoji': '🟢'
+        }
+    return configs
+
+def generate_update_corpus(num_updates, command_ratio=0.05, seed=7):
+    """Raw webhook bodies shaped like a busy group: mostly chatter, media and edits, a few commands."""
+    rng = random.Random(seed)
+    commands = ['/start', '/help', '/listtokens', '/addtoken ETH 0x1f9840a85d5af5bf1d1762f925bdaddc4201f984',
+                '/setemoji 💰', '/listtokens@BuyXanBot']
+    corpus = []
+    for update_id in range(num_updates):
+        chat = {"id": -1000000000000 - rng.randrange(500), "type": "supergroup", "title": "Token Holders"}
+        sender = {"id": rng.randrange(10 ** 9), "is_bot": False, "first_name": "holder", "language_code": "es"}
+        message = {"message_id": update_id, "from": sender, "chat": chat, "date": 1700000000 + update_id}
+        roll = rng.random()
+        if roll < command_ratio:
+            message["text"] = rng.choice(commands)
+            message["entities"] = [{"offset": 0, "length": len(message["text"].split(" ")[0]), "type": "bot_command"}]
+            update = {"update_id": update_id, "message": message}
+        elif roll < 0.75:
+            message["text"] = " ".join(rng.choice(("gm", "wen moon", "lfg", "comprado", "🚀", "holding /strong")) for _ in range(6))
+            update = {"update_id": update_id, "message": message}
+        elif roll < 0.9:
+            message["photo"] = [{"file_id": f"photo{update_id}", "width": 320, "height": 320}]
+            message["caption"] = "/listtokens chart"
+            update = {"update_id": update_id, "message": message}
+        else:
+            message["text"] = "editado"
+            update = {"update_id": update_id, "edited_message": message}
+        corpus.append(json.dumps(update, ensure_ascii=False).encode())
+    return corpus
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where `resource` is missing."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Keep the module-level singletons offline and file-free before app is imported
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("TELEGRAM_API_URL", "http://127.0.0.1:9")
+os.environ.setdefault("PRICE_FEED_URL", "http://127.0.0.1:9")
+os.environ["ALERT_JOURNAL_PATH"] = ""
+os.environ["POOL_INDEX_PATH"] = ""
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("REDIS_URL", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,118 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+
+TOKEN = '0x' + 'ab' * 20
+POOL = '0x' + 'cd' * 20
+BUYER = '0x' + 'ee' * 20
+UNISWAP_V2_FACTORY = '0x5c69bee701ef814a2b6a3edd4b1652cb9cc5aa6f'
+
+
+def word(value):
+    return '0x' + format(value, '064x')
+
+
+def start_http(handle_post, handle_get=None):
+    """Serve `handle_post(path, body)` / `handle_get(path)` as JSON on a local port; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'null')
+            self._reply(handle_post(self.path, body))
+
+        def do_GET(self):
+            self._reply(handle_get(self.path))
+
+        def _reply(self, response):
+            status, response = response if isinstance(response, tuple) else (200, response)
+            payload = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class EvmChainStub:
+    """
+    EVM JSON-RPC node: a head block, Transfer logs added with buy(), and the
+    eth_call answers detection and enrichment need (the token's one Uniswap
+    v2 pair, decimals, supply, balances). Every request is kept in `calls`.
+    """
+
+    def __init__(self, head=100):
+        self.head = head
+        self.logs = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def buy(self, block, token=TOKEN, buyer=BUYER, amount=10 ** 18):
+        """Add a Transfer of `token` from its pool to `buyer` in `block`; returns its txn hash."""
+        txn_hash = f"0x{len(self.logs) + 1:064x}"
+        self.logs.append({
+            'address': token,
+            'topics': [app.TRANSFER_TOPIC, '0x' + '0' * 24 + POOL[2:], '0x' + '0' * 24 + buyer[2:]],
+            'data': hex(amount),
+            'blockNumber': hex(block),
+            'transactionHash': txn_hash,
+            'logIndex': '0x0'
+        })
+        return txn_hash
+
+    def handle_post(self, path, body):
+        if isinstance(body, list):
+            return [self.rpc(request) for request in body]
+        return self.rpc(body)
+
+    def rpc(self, request):
+        method, params = request['method'], request.get('params') or []
+        with self._lock:
+            self.calls.append((method, params))
+        if method == 'eth_blockNumber':
+            result = hex(self.head)
+        elif method == 'eth_getLogs':
+            query = params[0]
+            start, end = int(query['fromBlock'], 16), int(query['toBlock'], 16)
+            addresses = set(query.get('address') or ())
+            result = [
+                log for log in self.logs
+                if start <= int(log['blockNumber'], 16) <= end and (not addresses or log['address'] in addresses)
+            ]
+        elif method == 'eth_call':
+            call = params[0]
+            selector = call['data'][:10]
+            if selector == app.SELECTOR_GET_PAIR:
+                result = word(int(POOL, 16) if call['to'] == UNISWAP_V2_FACTORY else 0)
+            else:
+                result = {
+                    app.SELECTOR_DECIMALS: word(18),
+                    app.SELECTOR_TOTAL_SUPPLY: word(10 ** 27),
+                    app.SELECTOR_BALANCE_OF: word(10 ** 24)
+                }.get(selector, '0x')
+        else:
+            result = None
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def calls_to(self, method):
+        with self._lock:
+            return [params for called, params in self.calls if called == method]
+
+
+class AlertCollector:
+    """Stands in for alert_coalescer: records (chat_id, txn_hash) of every queued alert."""
+
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, chat_id, config, enriched):
+        self.sent.append((chat_id, enriched['purchase']['txn_hash']))
@@ -0,0 +1,82 @@
+import pytest
+
+import app
+from stubs import TOKEN, AlertCollector, EvmChainStub, start_http
+
+
+class Crash(BaseException):
+    """Kills a monitor cycle the way a process crash would: nothing catches it."""
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    chain = EvmChainStub(head=100)
+    server = start_http(chain.handle_post)
+    store = app.ConfigStore()
+    store.add_token(1, 'ETH', TOKEN)
+    collector = AlertCollector()
+
+    monkeypatch.setattr(app, 'DATA_SOURCE', 'rpc')
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', server.url)
+    monkeypatch.setattr(app, 'config_store', store)
+    monkeypatch.setattr(app, 'bot_configs', store.configs)
+    monkeypatch.setattr(app, 'pool_index', app.PoolIndex(path=''))
+    monkeypatch.setattr(app, 'lookup_cache', app.TTLCache())
+    monkeypatch.setattr(app, 'alert_journal', app.AlertJournal(path=str(tmp_path / 'alerts.db')))
+    monkeypatch.setattr(app, 'alert_coalescer', collector)
+
+    # First sight of the token: its cursor starts at the head
+    app.monitor_all_chains_for_purchases()
+    yield chain, store, collector, tmp_path / 'alerts.db'
+    server.shutdown()
+
+
+def cursor(store):
+    return int(store.get_cursor(app.evm_log_detector.cursor_key('ETH', TOKEN)))
+
+
+def test_failed_enrichment_is_retried_next_cycle(env, monkeypatch):
+    chain, store, collector, _ = env
+    txn_hash = chain.buy(101)
+    chain.head = 101
+
+    def fail(*args):
+        raise RuntimeError("price API down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(app, 'get_cached_token_info', fail)
+        app.monitor_all_chains_for_purchases()
+    assert collector.sent == []
+    assert cursor(store) == 101  # Safe to move on: the purchase is journaled as pending
+
+    app.monitor_all_chains_for_purchases()
+    assert collector.sent == [(1, txn_hash)]
+
+
+@pytest.mark.parametrize('crash_after_write', [False, True])
+def test_purchase_survives_a_crash_around_the_cursor_write(env, monkeypatch, crash_after_write):
+    chain, store, _, journal_path = env
+    txn_hash = chain.buy(101)
+    chain.head = 101
+    save = store.set_cursors
+
+    def crash(values):
+        if crash_after_write:
+            save(values)
+        raise Crash()
+
+    monkeypatch.setattr(store, 'set_cursors', crash)
+    with pytest.raises(Crash):
+        app.monitor_all_chains_for_purchases()
+    assert cursor(store) == (101 if crash_after_write else 100)
+
+    # Restart: a new process with a fresh journal handle and alert queue
+    monkeypatch.setattr(store, 'set_cursors', save)
+    restarted = AlertCollector()
+    monkeypatch.setattr(app, 'alert_journal', app.AlertJournal(path=str(journal_path)))
+    monkeypatch.setattr(app, 'alert_coalescer', restarted)
+    app.monitor_all_chains_for_purchases()
+    app.monitor_all_chains_for_purchases()
+
+    assert restarted.sent == [(1, txn_hash)]
+    assert cursor(store) == 101
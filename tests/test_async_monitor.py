@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app
+from stubs import TOKEN, EvmChainStub, start_http
+
+
+class TelegramStub:
+    """Bot API stand-in: records every call, and answers 429 to chats in `rate_limited` once each."""
+
+    def __init__(self, rate_limited=()):
+        self.calls = []
+        self.rate_limited = set(rate_limited)
+        self._lock = threading.Lock()
+
+    def handle_post(self, path, body):
+        method = path.rsplit('/', 1)[-1]
+        with self._lock:
+            if body['chat_id'] in self.rate_limited:
+                self.rate_limited.discard(body['chat_id'])
+                return 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}}
+            self.calls.append((method, body['chat_id'], time.monotonic()))
+        return {'ok': True, 'result': {'message_id': len(self.calls)}}
+
+    def chats(self):
+        with self._lock:
+            return sorted(chat_id for _, chat_id, _ in self.calls)
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    chain = EvmChainStub(head=100)
+    rpc = start_http(chain.handle_post)
+    telegram = TelegramStub()
+    bot_api = start_http(telegram.handle_post)
+    store = app.ConfigStore()
+    for chat_id in (1, -2):
+        store.add_token(chat_id, 'ETH', TOKEN)
+
+    monkeypatch.setattr(app, 'DATA_SOURCE', 'rpc')
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', rpc.url)
+    monkeypatch.setattr(app, 'TELEGRAM_API_URL', bot_api.url)
+    monkeypatch.setattr(app, 'config_store', store)
+    monkeypatch.setattr(app, 'bot_configs', store.configs)
+    monkeypatch.setattr(app, 'pool_index', app.PoolIndex(path=''))
+    monkeypatch.setattr(app, 'lookup_cache', app.TTLCache())
+    monkeypatch.setattr(app, 'alert_journal', app.AlertJournal(path=str(tmp_path / 'alerts.db')))
+    monkeypatch.setattr(app, 'alert_coalescer', app.AlertCoalescer(window=0))
+    monkeypatch.setattr(app, 'telegram_dispatcher', app.TelegramDispatcher(global_rate=100, chat_rate=100,
+                                                                             group_rate=100))
+
+    # First sight of the token: its cursor starts at the head
+    asyncio.run(app.monitor_all_chains_for_purchases_async())
+    yield chain, telegram
+    rpc.shutdown()
+    bot_api.shutdown()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_async_cycle_alerts_every_subscribed_chat_once(env):
+    chain, telegram = env
+    chain.buy(101)
+    chain.head = 101
+
+    asyncio.run(app.monitor_all_chains_for_purchases_async())
+    wait_for(lambda: app.alert_journal.stats['delivered'] == 2)
+    assert telegram.chats() == [-2, 1]
+    assert {method for method, _, _ in telegram.calls} == {'sendMessage'}
+
+    # Nothing new on chain: nothing is re-sent
+    asyncio.run(app.monitor_all_chains_for_purchases_async())
+    assert app.telegram_dispatcher.join(5)
+    assert telegram.chats() == [-2, 1]
+
+
+def test_rate_limited_chat_does_not_hold_up_the_cycle(env):
+    chain, telegram = env
+    telegram.rate_limited = {-2}
+    chain.buy(101)
+    chain.head = 101
+
+    started = time.monotonic()
+    asyncio.run(app.monitor_all_chains_for_purchases_async())
+    assert time.monotonic() - started < 1  # The cycle doesn't wait out the retry_after
+
+    wait_for(lambda: app.alert_journal.stats['delivered'] == 2)
+    sent_at = {chat_id: at for _, chat_id, at in telegram.calls}
+    assert sent_at[-2] - sent_at[1] >= 0.9  # Only the limited chat waited
+    assert app.telegram_dispatcher.stats['rate_limited'] == 1
@@ -0,0 +1,152 @@
+import pytest
+
+import app
+from stubs import BUYER, TOKEN, EvmChainStub, start_http
+
+OTHER_TOKEN = '0x' + 'ba' * 20
+
+
+@pytest.fixture
+def env(monkeypatch):
+    chain = EvmChainStub(head=200)
+    server = start_http(chain.handle_post)
+    store = app.ConfigStore()
+    monkeypatch.setattr(app, 'DATA_SOURCE', 'rpc')
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', server.url)
+    monkeypatch.setattr(app, 'lookup_cache', app.TTLCache())
+    yield chain, store
+    server.shutdown()
+
+
+def detector(store, **kwargs):
+    return app.EvmLogPurchaseDetector(store=store, index=app.PoolIndex(path=''), **kwargs)
+
+
+def key(token):
+    return app.EvmLogPurchaseDetector.cursor_key('ETH', token)
+
+
+def cursors(store, *tokens):
+    return [store.get_cursor(key(token)) for token in tokens]
+
+
+def log_ranges(chain):
+    return [
+        (int(query['fromBlock'], 16), int(query['toBlock'], 16), sorted(set(query['address']) & {TOKEN, OTHER_TOKEN}))
+        for query, in chain.calls_to('eth_getLogs')
+    ]
+
+
+def test_first_poll_starts_at_the_head(env):
+    chain, store = env
+    chain.buy(150)
+
+    assert detector(store).poll('ETH', [TOKEN]) == []
+    assert chain.calls_to('eth_getLogs') == []
+    assert cursors(store, TOKEN) == [200]
+
+
+def test_contracts_share_one_get_logs_from_the_oldest_cursor(env):
+    chain, store = env
+    store.set_cursors({key(TOKEN): 100, key(OTHER_TOKEN): 150})
+    kept = chain.buy(120, token=TOKEN)
+    chain.buy(120, token=OTHER_TOKEN)  # Before OTHER_TOKEN's cursor: already processed
+    later = chain.buy(160, token=OTHER_TOKEN)
+
+    purchases = detector(store).poll('ETH', [TOKEN, OTHER_TOKEN])
+
+    assert log_ranges(chain) == [(101, 200, sorted([TOKEN, OTHER_TOKEN]))]
+    query = chain.calls_to('eth_getLogs')[0][0]
+    assert set(app.PoolIndex.factory_addresses('ETH')) <= set(query['address'])
+    assert sorted(purchase['txn_hash'] for purchase in purchases) == sorted([kept, later])
+    assert all(purchase['buyer_address'] == BUYER for purchase in purchases)
+    assert cursors(store, TOKEN, OTHER_TOKEN) == [200, 200]
+
+
+def test_distant_cursors_get_separate_windows(env):
+    chain, store = env
+    store.set_cursors({key(TOKEN): 100, key(OTHER_TOKEN): 180})
+
+    detector(store, max_block_range=50).poll('ETH', [TOKEN, OTHER_TOKEN])
+
+    assert log_ranges(chain) == [(101, 150, [TOKEN]), (181, 200, [OTHER_TOKEN])]
+    # The lagging contract catches up one window per poll
+    assert cursors(store, TOKEN, OTHER_TOKEN) == [150, 200]
+
+
+def test_confirmations_hold_back_the_head(env):
+    chain, store = env
+    store.set_cursors({key(TOKEN): 190})
+    chain.buy(199)
+
+    assert detector(store, confirmations=5).poll('ETH', [TOKEN]) == []
+    assert log_ranges(chain) == [(191, 195, [TOKEN])]
+    assert cursors(store, TOKEN) == [195]
+
+
+def test_up_to_date_cursor_skips_get_logs(env):
+    chain, store = env
+    store.set_cursors({key(TOKEN): 200})
+
+    assert detector(store).poll('ETH', [TOKEN]) == []
+    assert chain.calls_to('eth_getLogs') == []
+
+
+def test_caller_collected_cursors_are_not_saved(env):
+    chain, store = env
+    store.set_cursors({key(TOKEN): 100})
+    chain.buy(150)
+    collected = {}
+
+    assert len(detector(store).poll('ETH', [TOKEN], cursors=collected)) == 1
+
+    assert collected == {key(TOKEN): 200}
+    assert cursors(store, TOKEN) == [100]
+
+
+def test_batcher_sends_concurrent_calls_as_one_batch(env):
+    batcher = app.BatchingRpcClient(window_ms=50)
+
+    futures = [batcher.submit('ETH', 'eth_blockNumber', []) for _ in range(3)]
+    futures.append(batcher.submit('ETH', 'eth_call', [{'to': TOKEN, 'data': app.SELECTOR_DECIMALS}, 'latest']))
+
+    assert [future.result(5) for future in futures] == ['0xc8'] * 3 + ['0x' + format(18, '064x')]
+    assert batcher.stats == {'calls': 4, 'batches': 1}
+
+
+def test_batcher_fails_only_the_rejected_call(monkeypatch):
+    def handle_post(path, body):
+        return [
+            {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': 'execution reverted'}}
+            if request['method'] == 'eth_call' else
+            {'jsonrpc': '2.0', 'id': request['id'], 'result': '0x1'}
+            for request in body
+        ]
+
+    server = start_http(handle_post)
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', server.url)
+    batcher = app.BatchingRpcClient(window_ms=50)
+    try:
+        ok = batcher.submit('ETH', 'eth_blockNumber', [])
+        reverted = batcher.submit('ETH', 'eth_call', [{'to': TOKEN, 'data': '0x'}, 'latest'])
+
+        assert ok.result(5) == '0x1'
+        with pytest.raises(RuntimeError, match='execution reverted'):
+            reverted.result(5)
+    finally:
+        server.shutdown()
+
+
+def test_batcher_fails_every_call_when_the_batch_is_rejected(monkeypatch):
+    server = start_http(lambda path, body: {'jsonrpc': '2.0', 'id': None,
+                                            'error': {'code': -32600, 'message': 'batches not allowed'}})
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', server.url)
+    batcher = app.BatchingRpcClient(window_ms=50)
+    try:
+        futures = [batcher.submit('ETH', 'eth_blockNumber', []) for _ in range(2)]
+
+        for future in futures:
+            with pytest.raises(RuntimeError, match='batches not allowed'):
+                future.result(5)
+    finally:
+        server.shutdown()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import app
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py get/set(px) calls RedisCache makes, on a manual clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}  # key -> (expires_at, value)
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None or entry[0] <= self.now:
+            self.data.pop(key, None)
+            return None
+        return entry[1]
+
+    def set(self, key, value, px=None):
+        self.data[key] = (self.now + px / 1000 if px else float('inf'), value.encode())
+        return True
+
+
+def test_entries_expire_after_their_ttl():
+    client = FakeRedis()
+    cache = app.RedisCache(client)
+
+    cache.set(('price', 'ETH', '0xabc'), {'price_usd': 1.5}, ttl=10)
+    client.now = 9.9
+    assert cache.get(('price', 'ETH', '0xabc')) == {'price_usd': 1.5}
+
+    client.now = 10.0
+    assert cache.get(('price', 'ETH', '0xabc')) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_get_or_load_reloads_once_expired():
+    client = FakeRedis()
+    cache = app.RedisCache(client)
+    calls = []
+
+    def loader():
+        calls.append(client.now)
+        return len(calls)
+
+    assert cache.get_or_load('supply', loader, ttl=5) == 1
+    assert cache.get_or_load('supply', loader, ttl=5) == 1
+    client.now = 5.0
+    assert cache.get_or_load('supply', loader, ttl=5) == 2
+    assert calls == [0.0, 5.0]
+
+
+def test_concurrent_misses_run_the_loader_once():
+    cache = app.RedisCache(FakeRedis())
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return {'total_supply': 10 ** 9}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load(('supply', 'ETH', '0xabc'), loader)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    # Wait until every follower is parked on the leader's future
+    while cache.stats()['coalesced'] + cache.stats()['loads'] < len(threads):
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [{'total_supply': 10 ** 9}] * len(threads)
+    assert cache.stats()['loads'] == 1
+    assert cache.stats()['coalesced'] == len(threads) - 1
+
+
+def test_entries_are_shared_between_processes():
+    client = FakeRedis()
+    app.RedisCache(client).set(('balance', 'ETH', '0xabc', '0xdef'), 42, ttl=5)
+
+    other = app.RedisCache(client)
+    assert other.get_or_load(('balance', 'ETH', '0xabc', '0xdef'), lambda: 0) == 42
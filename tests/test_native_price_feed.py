@@ -0,0 +1,95 @@
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import app
+from stubs import start_http
+
+
+class PriceStub:
+    """Simple-price API stand-in: serves `quotes`, or `status` with an error body when it isn't 200."""
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+        self.status = 200
+        self.requests = []
+
+    def handle_get(self, path):
+        self.requests.append(parse_qs(urlsplit(path).query))
+        if self.status != 200:
+            return self.status, {'error': 'upstream unavailable'}
+        return self.quotes
+
+
+@pytest.fixture
+def prices():
+    stub = PriceStub({'ethereum': {'usd': 4000}, 'solana': {'usd': 200}, 'binancecoin': {'usd': 700}})
+    server = start_http(None, stub.handle_get)
+    yield stub, server.url
+    server.shutdown()
+
+
+def test_refresh_fetches_every_chain_in_one_request(prices):
+    stub, url = prices
+    feed = app.NativePriceFeed(url=url, max_age=60)
+
+    assert feed.refresh()
+
+    assert len(stub.requests) == 1
+    assert stub.requests[0]['ids'] == ['binancecoin,ethereum,solana']
+    assert {chain: feed.get_price(chain) for chain in app.SUPPORTED_CHAINS} == {
+        'ETH': 4000, 'SOLANA': 200, 'BNB': 700, 'BASE': 4000
+    }
+    assert not feed.is_stale()
+
+
+def test_uses_configured_prices_until_first_refresh(prices):
+    _, url = prices
+    feed = app.NativePriceFeed(url=url)
+
+    assert feed.is_stale() and feed.age() is None
+    assert feed.get_price('SOLANA') == app.SUPPORTED_CHAINS['SOLANA']['native_price']
+
+
+def test_failed_refresh_keeps_last_known_prices_and_goes_stale(prices):
+    stub, url = prices
+    feed = app.NativePriceFeed(url=url, max_age=0.1)
+    assert feed.refresh()
+
+    stub.status = 500
+    stub.quotes = {'ethereum': {'usd': 1}}
+    assert not feed.refresh()
+    assert feed.get_price('ETH') == 4000
+    assert not feed.is_stale()
+
+    time.sleep(0.15)
+    assert not feed.refresh()
+    assert feed.is_stale()
+    assert feed.get_price('ETH') == 4000
+
+    # Recovery clears the staleness
+    stub.status = 200
+    assert feed.refresh()
+    assert feed.get_price('ETH') == 1 and not feed.is_stale()
+
+
+def test_missing_or_invalid_quotes_keep_the_previous_price(prices):
+    stub, url = prices
+    feed = app.NativePriceFeed(url=url)
+    assert feed.refresh()
+
+    stub.quotes = {'ethereum': {'usd': 0}, 'solana': {'usd': 'n/a'}}
+    assert feed.refresh()
+
+    assert feed.get_price('ETH') == 4000
+    assert feed.get_price('SOLANA') == 200
+    assert feed.get_price('BNB') == 700
+
+
+def test_unreachable_feed_keeps_last_known_prices():
+    feed = app.NativePriceFeed(url='http://127.0.0.1:9')
+
+    assert not feed.refresh()
+    assert feed.get_price('BNB') == app.SUPPORTED_CHAINS['BNB']['native_price']
+    assert feed.is_stale()
@@ -0,0 +1,33 @@
+import time
+
+import app
+
+
+def test_stop_waits_for_the_sampler_thread():
+    profiler = app.SamplingProfiler(interval=0.001)
+    profiler.start()
+    while profiler.samples < 3:
+        time.sleep(0.001)
+    thread = profiler._thread
+
+    profiler.stop()
+
+    assert not thread.is_alive() and not profiler.running
+    samples = profiler.samples
+    time.sleep(0.01)
+    assert profiler.samples == samples  # Nothing sampled after stop() returned
+
+
+def test_restart_after_stop_samples_again():
+    profiler = app.SamplingProfiler(interval=0.001)
+    profiler.start()
+    profiler.stop()
+    profiler.reset()
+
+    profiler.start()
+    while profiler.samples < 1:
+        time.sleep(0.001)
+    profiler.stop()
+
+    assert not profiler.running
+    assert profiler.collapsed()
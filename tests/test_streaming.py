@@ -0,0 +1,214 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+websockets = pytest.importorskip("websockets")
+
+TOKEN = '0x' + 'ab' * 20
+POOL = '0x' + 'cd' * 20
+
+
+class FakeChain:
+    """EVM node stand-in: JSON-RPC over HTTP plus eth_subscribe over a websocket."""
+
+    def __init__(self, head):
+        self.head = head
+        self.logs = {}
+        self.loop = None
+        self.subscribers = []
+        self.mine_on_block_number = 0
+        self._lock = threading.Lock()
+
+    def transfer_log(self, block):
+        return {
+            'address': TOKEN,
+            'topics': [app.TRANSFER_TOPIC, '0x' + '0' * 24 + POOL[2:], '0x' + '0' * 24 + 'ee' * 20],
+            'data': hex(10 ** 18),
+            'blockNumber': hex(block),
+            'transactionHash': f"0x{block:064x}",
+            'logIndex': '0x0'
+        }
+
+    def mine(self):
+        with self._lock:
+            self.head += 1
+            log = self.logs[self.head] = self.transfer_log(self.head)
+            subscribers = list(self.subscribers)
+        for ws, subscription in subscribers:
+            message = json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription',
+                                  'params': {'subscription': subscription, 'result': log}})
+            self.loop.call_soon_threadsafe(lambda ws=ws, message=message: asyncio.ensure_future(ws.send(message)))
+
+    def rpc(self, request):
+        method, params = request['method'], request.get('params') or []
+        if method == 'eth_blockNumber':
+            result = hex(self.head)
+            # Blocks mined right after the backfill read the head
+            for _ in range(self.mine_on_block_number):
+                self.mine()
+            self.mine_on_block_number = 0
+        elif method == 'eth_getLogs':
+            start, end = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+            result = [log for block, log in sorted(self.logs.items()) if start <= block <= end]
+        elif method == 'eth_call':
+            selector = params[0]['data'][:10]
+            word = lambda value: '0x' + format(value, '064x')
+            result = {
+                app.SELECTOR_DECIMALS: word(18),
+                app.SELECTOR_GET_PAIR: word(int(POOL, 16)) if params[0]['to'].startswith('0x5c69') else word(0)
+            }.get(selector, '0x')
+        else:
+            result = None
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    async def serve_ws(self, ws):
+        async for raw in ws:
+            request = json.loads(raw)
+            if request['method'] == 'eth_subscribe':
+                with self._lock:
+                    self.subscribers.append((ws, '0x1'))
+                result = '0x1'
+            else:
+                result = True
+            await ws.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': result}))
+
+
+def start_http(chain):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            response = [chain.rpc(item) for item in body] if isinstance(body, list) else chain.rpc(body)
+            payload = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stream_env(monkeypatch):
+    chain = FakeChain(head=102)
+    chain.logs = {block: chain.transfer_log(block) for block in (101, 102)}
+    server = start_http(chain)
+
+    store = app.ConfigStore()
+    store.add_token(1, 'ETH', TOKEN)
+    store.set_cursors({app.evm_log_detector.cursor_key('ETH', TOKEN): 100})
+    delivered = []
+
+    monkeypatch.setattr(app, 'DATA_SOURCE', 'rpc')
+    monkeypatch.setattr(app, 'config_store', store)
+    monkeypatch.setattr(app, 'bot_configs', store.configs)
+    monkeypatch.setattr(app, 'pool_index', app.PoolIndex(path=''))
+    monkeypatch.setattr(app, 'lookup_cache', app.TTLCache())
+    monkeypatch.setitem(app.SUPPORTED_CHAINS['ETH'], 'rpc_url', f"http://127.0.0.1:{server.server_port}")
+
+    def dispatch(chain_name, purchases, subscriptions, cursors=None):
+        delivered.extend(purchase['block_number'] for purchase in purchases)
+        if cursors:
+            store.set_cursors(cursors)
+
+    monkeypatch.setattr(app, 'dispatch_purchases', dispatch)
+    yield chain, delivered
+    server.shutdown()
+
+
+def run_stream(chain, delivered, expected):
+    async def scenario():
+        chain.loop = asyncio.get_running_loop()
+        async with websockets.serve(chain.serve_ws, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            stream = app.ChainStream('ETH', f"ws://127.0.0.1:{port}")
+            task = asyncio.create_task(stream.run())
+            try:
+                for _ in range(100):
+                    if expected <= set(delivered):
+                        break
+                    await asyncio.sleep(0.05)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        return stream
+
+    return asyncio.run(scenario())
+
+
+def test_backfill_and_stream_leave_no_gap(stream_env):
+    chain, delivered = stream_env
+    # Block 103 lands after the backfill read the head (102)
+    chain.mine_on_block_number = 1
+
+    run_stream(chain, delivered, {101, 102, 103})
+
+    assert {101, 102, 103} <= set(delivered)
+
+
+def test_buffered_notifications_do_not_rewind_cursors(stream_env):
+    chain, delivered = stream_env
+    chain.mine_on_block_number = 1
+
+    run_stream(chain, delivered, {103})
+
+    cursor = app.config_store.get_cursor(app.evm_log_detector.cursor_key('ETH', TOKEN))
+    assert int(cursor) >= 102
+
+
+def test_streaming_refuses_simulated_data(monkeypatch):
+    monkeypatch.setattr(app, 'DATA_SOURCE', 'mock')
+
+    with pytest.raises(RuntimeError, match='DATA_SOURCE=rpc'):
+        asyncio.run(app.StreamingIngest(chains=[]).run())
+
+
+def test_solana_notification_fetches_only_its_transaction(monkeypatch):
+    mint, buyer = 'Mint1111111111111111111111111111111111111111', 'Buyer111111111111111111111111111111111111111'
+    calls = []
+
+    def submit(chain, method, params):
+        calls.append(method)
+        future = Future()
+        future.set_result({
+            'slot': 7,
+            'blockTime': 1,
+            'transaction': {'message': {
+                'accountKeys': [buyer, app.RAYDIUM_AMM_V4_PROGRAM_ID],
+                'instructions': [{'programIdIndex': 1}]
+            }},
+            'meta': {
+                'err': None, 'fee': 5000, 'preBalances': [2 * 10 ** 9], 'postBalances': [10 ** 9],
+                'preTokenBalances': [],
+                'postTokenBalances': [{'owner': buyer, 'mint': mint, 'uiTokenAmount': {'amount': '500', 'decimals': 2}}]
+            }
+        } if method == 'getTransaction' else {})
+        return future
+
+    dispatched = []
+    monkeypatch.setattr(app.rpc_batcher, 'submit', submit)
+    monkeypatch.setattr(app.rpc_batcher, 'call',
+                        lambda chain, method, params, timeout=30: submit(chain, method, params).result())
+    monkeypatch.setattr(app, 'lookup_cache', app.TTLCache())
+    monkeypatch.setattr(app, 'poll_scheduler', app.AdaptivePollScheduler())
+    monkeypatch.setattr(app, 'dispatch_purchases', lambda chain, purchases, subscriptions: dispatched.extend(purchases))
+    stream = app.ChainStream('SOLANA', 'ws://unused')
+    stream._solana_subscriptions = {5: mint}
+
+    stream._handle_notification({'subscription': 5, 'result': {'value': {'signature': 'sig1', 'err': None}}})
+
+    assert [purchase['txn_hash'] for purchase in dispatched] == ['sig1']
+    assert dispatched[0]['token_amount'] == 5
+    assert 'getSignaturesForAddress' not in calls and calls.count('getTransaction') == 1
+    assert app.poll_scheduler.stats['woken'] == 1